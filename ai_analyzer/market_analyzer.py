@@ -7,6 +7,7 @@ import asyncio
 import json
 import logging
 import os
+from collections import Counter
 from datetime import datetime, timedelta
 from typing import Dict, List, Optional, Tuple, Any
 
@@ -20,6 +21,7 @@ except ImportError:
 from pybit.unified_trading import HTTP as PybitHTTP
 
 from config.settings import get_settings
+from core.data_processor import tail, ts_to_datetime
 
 
 class MarketAnalyzer:
@@ -182,7 +184,7 @@ class MarketAnalyzer:
             if not hasattr(self.websocket_manager, 'kline_data'):
                 return []
             
-            klines = self.websocket_manager.kline_data[-20:]  # Последние 20 свечей
+            klines = tail(self.websocket_manager.kline_data, 20)  # Последние 20 свечей
             return [
                 {
                     "timestamp": kline.get("timestamp", 0),
@@ -208,11 +210,12 @@ class MarketAnalyzer:
             if not orderbook:
                 return {}
             
+            timestamp = orderbook.get("timestamp")
             return {
                 "bids": orderbook.get("bids", [])[:5],
                 "asks": orderbook.get("asks", [])[:5],
                 "spread": orderbook.get("spread", 0),
-                "timestamp": orderbook.get("timestamp")
+                "timestamp": ts_to_datetime(timestamp).isoformat() if timestamp else None
             }
         except Exception as e:
             self.logger.error(f"Ошибка получения orderbook: {e}")
@@ -224,18 +227,18 @@ class MarketAnalyzer:
             if not hasattr(self.websocket_manager, 'trade_data'):
                 return {}
             
-            trades = self.websocket_manager.trade_data[-50:]  # Последние 50 сделок
+            trades = tail(self.websocket_manager.trade_data, 50)  # Последние 50 сделок
             if not trades:
                 return {}
             
-            buy_trades = [t for t in trades if t.get("side", "").upper() == "BUY"]
-            sell_trades = [t for t in trades if t.get("side", "").upper() == "SELL"]
+            # Стороны уже нормализованы в "BUY"/"SELL" при приеме сделок - один проход подсчета
+            side_counts = Counter(t.get("side") for t in trades)
             
             return {
                 "total_trades": len(trades),
-                "buy_trades": len(buy_trades),
-                "sell_trades": len(sell_trades),
-                "latest_trades": trades[-10:] if trades else []
+                "buy_trades": side_counts["BUY"],
+                "sell_trades": side_counts["SELL"],
+                "latest_trades": [t._asdict() for t in trades[-10:]]
             }
         except Exception as e:
             self.logger.error(f"Ошибка получения trades: {e}")
@@ -247,7 +250,7 @@ class MarketAnalyzer:
             if not hasattr(self.websocket_manager, 'kline_data'):
                 return {}
             
-            klines = self.websocket_manager.kline_data[-20:]
+            klines = tail(self.websocket_manager.kline_data, 20)
             if not klines:
                 return {}
             
@@ -508,7 +511,7 @@ Bollinger Lower: {indicators.get('bb_lower', 'N/A')}"""
                 try:
                     change_value = float(change_24h.replace("%", "").replace("+", ""))
                     trend_emoji = "🚀" if change_value > 2 else "📈" if change_value > 0 else "📉" if change_value < -2 else "➡️"
-                except:
+                except ValueError:
                     trend_emoji = "📊"
             else:
                 trend_emoji = "📊"
@@ -94,6 +94,8 @@ class Settings:
         self.WS_PING_INTERVAL: int = get_env_int("WS_PING_INTERVAL", 20)
         self.WS_RECONNECT_ATTEMPTS: int = get_env_int("WS_RECONNECT_ATTEMPTS", 5)
         self.WS_RECONNECT_DELAY: int = get_env_int("WS_RECONNECT_DELAY", 5)
+        # Привязывается весь event loop приложения (WebSocket, uvicorn/FastAPI, Telegram), не отдельный поток WS
+        self.WS_CPU_CORE: int = get_env_int("BYBIT_WS_CORE", -1)  # -1 = без привязки к ядру (только Linux)
         
         # Настройки данных
         self.KLINE_LIMIT: int = get_env_int("KLINE_LIMIT", 100)
@@ -347,6 +349,7 @@ TELEGRAM_CHAT_ID=your_chat_id_here
 # Дополнительные настройки
 LOG_LEVEL=INFO
 WS_PING_INTERVAL=20
+# BYBIT_WS_CORE=1  # Привязать весь event loop приложения (WebSocket, API, Telegram) к ядру CPU (Linux)
 KLINE_LIMIT=100
 MAX_DAILY_SIGNALS=100
 SIGNAL_COOLDOWN_MINUTES=5
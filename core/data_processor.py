@@ -4,10 +4,142 @@
 """
 
 import logging
+import time
+from collections import deque, namedtuple
 from datetime import datetime
+from itertools import islice
+from operator import itemgetter
 from typing import Dict, List, Optional, Any, Tuple
 
 
+# Канонические стороны сделок: Bybit присылает "Buy"/"Sell", храним "BUY"/"SELL"
+TRADE_SIDES = {"Buy": "BUY", "Sell": "SELL", "BUY": "BUY", "SELL": "SELL"}
+
+
+def normalize_side(side: str) -> str:
+    """Приведение стороны сделки к каноническому виду без .upper() для известных значений"""
+    return TRADE_SIDES.get(side) or side.upper()
+
+
+def ts_to_datetime(timestamp_ms: int) -> datetime:
+    """Перевод ms-таймстампа Bybit в datetime - только для отображения, в данных не храним"""
+    return datetime.fromtimestamp(timestamp_ms / 1000)
+
+
+def tail(buffer, count: int) -> list:
+    """Последние count элементов буфера списком (кольцевые буферы deque не поддерживают срезы)"""
+    return list(islice(buffer, max(len(buffer) - count, 0), None))
+
+
+class _RecordAccess:
+    """Доступ к полям namedtuple-записи как к dict: r["field"] и r.get("field")"""
+    __slots__ = ()
+    
+    def __getitem__(self, key):
+        if key.__class__ is str:
+            # Только поля записи - не методы tuple вроде count/index
+            if key in self._fields:
+                return getattr(self, key)
+            raise KeyError(key)
+        return tuple.__getitem__(self, key)
+    
+    def get(self, key: str, default: Any = None) -> Any:
+        return getattr(self, key) if key in self._fields else default
+
+
+class Kline(_RecordAccess, namedtuple("Kline", (
+    "symbol", "timestamp", "interval", "confirm",
+    "open", "high", "low", "close", "volume",
+    "body", "range", "upper_shadow", "lower_shadow",
+    "change_percent", "range_percent", "body_percent",
+    "candle_type", "close_position", "volume_price_ratio",
+    "processed_at", "data_source"
+))):
+    """Компактная запись свечи; k["close"] и k.get() сохранены для читателей, ожидающих dict"""
+    __slots__ = ()
+
+
+# Дефолтные периоды технических индикаторов
+DEFAULT_INDICATOR_PERIODS = {
+    "rsi": 14,
+    "sma_short": 9,
+    "sma_long": 21,
+    "ema_short": 12,
+    "ema_long": 26,
+    "bb_period": 20
+}
+
+
+class RollingWindow:
+    """Скользящее окно с накопленными суммой и суммой квадратов: среднее и отклонение за O(1)"""
+    
+    __slots__ = ("values", "total", "total_sq", "_pushes")
+    
+    def __init__(self, size: int):
+        self.values = deque(maxlen=size)
+        self.total = 0.0
+        self.total_sq = 0.0
+        self._pushes = 0
+    
+    def push(self, value: float):
+        values = self.values
+        if len(values) == values.maxlen:
+            old = values[0]
+            self.total -= old
+            self.total_sq -= old * old
+        values.append(value)
+        self.total += value
+        self.total_sq += value * value
+        
+        # Раз в размер окна суммы пересчитываются точно - ошибка округления не накапливается
+        self._pushes += 1
+        if self._pushes >= values.maxlen:
+            self._pushes = 0
+            self.total = sum(values)
+            self.total_sq = sum(v * v for v in values)
+    
+    def full(self) -> bool:
+        return len(self.values) == self.values.maxlen
+    
+    def mean(self) -> float:
+        return self.total / len(self.values)
+    
+    def std(self) -> float:
+        """Стандартное отклонение по генеральной совокупности (как в _calculate_bollinger_bands)"""
+        mean = self.total / len(self.values)
+        return max(self.total_sq / len(self.values) - mean * mean, 0.0) ** 0.5
+
+
+class IndicatorState:
+    """Инкрементальное состояние индикаторов по подтвержденным свечам (обновляется DataProcessor.update_indicators)"""
+    
+    def __init__(self, periods: Dict = None):
+        self.periods = periods = periods or DEFAULT_INDICATOR_PERIODS
+        self.last_close: Optional[float] = None
+        self.last_volume = 0.0
+        self.last_timestamp = None
+        # EMA и суммы окон SMA/BB/RSI обновляются за O(1) на свечу. EMA помнит всю историю, а
+        # calculate_technical_indicators по усеченному окну затравливается в начале окна,
+        # поэтому EMA/MACD совпадают с ним только на одном ряду
+        self.ema: Dict[str, Optional[float]] = {"ema_short": None, "ema_long": None}
+        self.ema_seed = {"ema_short": 0.0, "ema_long": 0.0}  # сумма первых period закрытий (затравка SMA)
+        self.count = 0
+        
+        # Скользящие окна закрытий и изменений цены (для RSI)
+        self.sma_short = RollingWindow(periods["sma_short"])
+        self.sma_long = RollingWindow(periods["sma_long"])
+        self.bb = RollingWindow(periods["bb_period"])
+        self.volatility = RollingWindow(20)
+        self.gains = RollingWindow(periods["rsi"])
+        self.losses = RollingWindow(periods["rsi"])
+        
+        self._snapshot: Dict = {}
+    
+    def snapshot(self) -> Dict:
+        """Текущие значения индикаторов (пересчитываются только при новой свече)"""
+        return self._snapshot
+
+
 class DataProcessor:
     """Обработка и валидация рыночных данных"""
     
@@ -15,42 +147,44 @@ class DataProcessor:
         self.logger = logging.getLogger(__name__)
         self.logger.info("DataProcessor инициализирован")
     
-    def process_kline(self, raw_kline: Dict) -> Optional[Dict]:
-        """Обработка и валидация kline данных"""
+    def process_kline(self, raw_kline: Dict) -> Optional[Kline]:
+        """Обработка и валидация kline данных (результат - запись Kline, без промежуточного dict)"""
         try:
             if not self._validate_kline(raw_kline):
                 return None
             
-            processed_kline = {
+            # OHLCV приводятся к float один раз
+            open_price = float(raw_kline["open"])
+            high_price = float(raw_kline["high"])
+            low_price = float(raw_kline["low"])
+            close_price = float(raw_kline["close"])
+            volume = float(raw_kline["volume"])
+            
+            return Kline(
                 # Основные данные
-                "symbol": raw_kline["symbol"],
-                "timestamp": raw_kline["timestamp"],
-                "datetime": datetime.fromtimestamp(raw_kline["timestamp"] / 1000) if raw_kline["timestamp"] else datetime.now(),
-                "interval": raw_kline.get("interval", "5"),
-                "confirm": raw_kline.get("confirm", False),
+                raw_kline["symbol"],
+                raw_kline["timestamp"],
+                raw_kline.get("interval", "5"),
+                raw_kline.get("confirm", False),
                 
                 # OHLCV
-                "open": float(raw_kline["open"]),
-                "high": float(raw_kline["high"]),
-                "low": float(raw_kline["low"]),
-                "close": float(raw_kline["close"]),
-                "volume": float(raw_kline["volume"]),
+                open_price,
+                high_price,
+                low_price,
+                close_price,
+                volume,
                 
                 # Дополнительные метрики
-                "body": abs(float(raw_kline["close"]) - float(raw_kline["open"])),
-                "range": float(raw_kline["high"]) - float(raw_kline["low"]),
-                "upper_shadow": float(raw_kline["high"]) - max(float(raw_kline["open"]), float(raw_kline["close"])),
-                "lower_shadow": min(float(raw_kline["open"]), float(raw_kline["close"])) - float(raw_kline["low"]),
+                abs(close_price - open_price),
+                high_price - low_price,
+                high_price - max(open_price, close_price),
+                min(open_price, close_price) - low_price,
+                *self._calculate_kline_metrics(open_price, high_price, low_price, close_price, volume),
                 
-                # Метаданные обработки
-                "processed_at": datetime.now(),
-                "data_source": "websocket"
-            }
-            
-            # Вычисляем дополнительные метрики
-            processed_kline.update(self._calculate_kline_metrics(processed_kline))
-            
-            return processed_kline
+                # Метаданные обработки (время кадра WebSocket, если есть)
+                raw_kline.get("raw_timestamp") or datetime.now(),
+                "websocket"
+            )
             
         except Exception as e:
             self.logger.error(f"Ошибка обработки kline: {e}")
@@ -77,8 +211,8 @@ class DataProcessor:
                 "spread": float(raw_ticker.get("ask1_price", 0)) - float(raw_ticker.get("bid1_price", 0)),
                 "mid_price": (float(raw_ticker.get("ask1_price", 0)) + float(raw_ticker.get("bid1_price", 0))) / 2,
                 
-                # Метаданные
-                "processed_at": datetime.now(),
+                # Метаданные (время кадра WebSocket, если есть)
+                "processed_at": raw_ticker.get("raw_timestamp") or datetime.now(),
                 "data_source": "websocket"
             }
             
@@ -107,7 +241,7 @@ class DataProcessor:
                 "symbol": raw_orderbook["symbol"],
                 "bids": bids,
                 "asks": asks,
-                "timestamp": raw_orderbook.get("timestamp", int(datetime.now().timestamp() * 1000)),
+                "timestamp": raw_orderbook.get("timestamp") or time.time_ns() // 1_000_000,
                 
                 # Вычисляемые поля
                 "best_bid": float(bids[0][0]) if bids else 0,
@@ -115,8 +249,8 @@ class DataProcessor:
                 "best_bid_size": float(bids[0][1]) if bids else 0,
                 "best_ask_size": float(asks[0][1]) if asks else 0,
                 
-                # Метаданные
-                "processed_at": datetime.now(),
+                # Метаданные (время кадра WebSocket, если есть)
+                "processed_at": raw_orderbook.get("raw_timestamp") or datetime.now(),
                 "data_source": "websocket"
             }
             
@@ -130,30 +264,41 @@ class DataProcessor:
             return None
     
     def process_trades(self, raw_trades: List[Dict]) -> List[Dict]:
-        """Обработка и валидация trade данных"""
+        """Обработка и валидация trade данных одним проходом по пакету"""
         processed_trades = []
         
         try:
+            # Одно время обработки на весь пакет сделок: время кадра WebSocket, если есть
+            processed_at = (raw_trades[0].get("raw_timestamp") if raw_trades else None) or datetime.now()
+            append = processed_trades.append
+            
+            # Валидация совмещена с разбором: price/size приводятся к float один раз
             for trade in raw_trades:
-                if not self._validate_trade(trade):
+                try:
+                    symbol = trade["symbol"]
+                    timestamp = trade["timestamp"]
+                    side = trade["side"]
+                    price = float(trade["price"])
+                    size = float(trade["size"])
+                except (KeyError, ValueError, TypeError):
+                    continue
+                
+                if symbol is None or timestamp is None or side is None:
                     continue
                 
-                processed_trade = {
-                    "symbol": trade["symbol"],
+                append({
+                    "symbol": symbol,
                     "trade_id": trade.get("trade_id", ""),
-                    "timestamp": trade["timestamp"],
-                    "datetime": datetime.fromtimestamp(trade["timestamp"] / 1000) if trade["timestamp"] else datetime.now(),
-                    "price": float(trade["price"]),
-                    "size": float(trade["size"]),
-                    "side": trade["side"].upper(),
-                    "value": float(trade["price"]) * float(trade["size"]),
+                    "timestamp": timestamp,
+                    "price": price,
+                    "size": size,
+                    "side": normalize_side(side),
+                    "value": price * size,
                     
                     # Метаданные
-                    "processed_at": datetime.now(),
+                    "processed_at": processed_at,
                     "data_source": "websocket"
-                }
-                
-                processed_trades.append(processed_trade)
+                })
                 
             return processed_trades
             
@@ -221,63 +366,34 @@ class DataProcessor:
         
         return True
     
-    def _validate_trade(self, trade: Dict) -> bool:
-        """Валидация trade данных"""
-        required_fields = ["symbol", "timestamp", "price", "size", "side"]
-        
-        for field in required_fields:
-            if field not in trade or trade[field] is None:
-                return False
-        
-        try:
-            float(trade["price"])
-            float(trade["size"])
-        except (ValueError, TypeError):
-            return False
-        
-        return True
-    
-    def _calculate_kline_metrics(self, kline: Dict) -> Dict:
-        """Вычисление дополнительных метрик для kline"""
-        metrics = {}
-        
-        try:
-            o, h, l, c = kline["open"], kline["high"], kline["low"], kline["close"]
-            
-            # Процентные изменения
-            if o > 0:
-                metrics["change_percent"] = ((c - o) / o) * 100
-                metrics["range_percent"] = ((h - l) / o) * 100
-                metrics["body_percent"] = (abs(c - o) / (h - l)) * 100 if (h - l) > 0 else 0
-            else:
-                metrics["change_percent"] = 0
-                metrics["range_percent"] = 0
-                metrics["body_percent"] = 0
-            
-            # Тип свечи
-            if c > o:
-                metrics["candle_type"] = "bullish"
-            elif c < o:
-                metrics["candle_type"] = "bearish"
-            else:
-                metrics["candle_type"] = "doji"
-            
-            # Позиция закрытия (0-100%)
-            if (h - l) > 0:
-                metrics["close_position"] = ((c - l) / (h - l)) * 100
-            else:
-                metrics["close_position"] = 50
-            
-            # Объем на цену
-            if c > 0:
-                metrics["volume_price_ratio"] = kline["volume"] / c
-            else:
-                metrics["volume_price_ratio"] = 0
-            
-        except Exception as e:
-            self.logger.debug(f"Ошибка вычисления kline метрик: {e}")
-        
-        return metrics
+    @staticmethod
+    def _calculate_kline_metrics(o: float, h: float, l: float, c: float, volume: float) -> Tuple:
+        """Дополнительные метрики kline в порядке полей Kline (change_percent ... volume_price_ratio)"""
+        price_range = h - l
+        
+        # Процентные изменения
+        if o > 0:
+            change_percent = ((c - o) / o) * 100
+            range_percent = (price_range / o) * 100
+            body_percent = (abs(c - o) / price_range) * 100 if price_range > 0 else 0
+        else:
+            change_percent = range_percent = body_percent = 0
+        
+        # Тип свечи
+        if c > o:
+            candle_type = "bullish"
+        elif c < o:
+            candle_type = "bearish"
+        else:
+            candle_type = "doji"
+        
+        # Позиция закрытия (0-100%)
+        close_position = ((c - l) / price_range) * 100 if price_range > 0 else 50
+        
+        # Объем на цену
+        volume_price_ratio = volume / c if c > 0 else 0
+        
+        return change_percent, range_percent, body_percent, candle_type, close_position, volume_price_ratio
     
     def _calculate_orderbook_metrics(self, orderbook: Dict) -> Dict:
         """Вычисление дополнительных метрик для orderbook"""
@@ -290,16 +406,17 @@ class DataProcessor:
             if not bids or not asks:
                 return metrics
             
-            # Спред
-            best_bid = float(bids[0][0])
-            best_ask = float(asks[0][0])
+            # Спред (лучшие цены уже посчитаны в process_orderbook)
+            best_bid = orderbook.get("best_bid") or float(bids[0][0])
+            best_ask = orderbook.get("best_ask") or float(asks[0][0])
             metrics["spread"] = best_ask - best_bid
             metrics["spread_percent"] = (metrics["spread"] / best_bid) * 100 if best_bid > 0 else 0
             metrics["mid_price"] = (best_bid + best_ask) / 2
             
-            # Объемы
-            total_bid_volume = sum(float(bid[1]) for bid in bids[:5])
-            total_ask_volume = sum(float(ask[1]) for ask in asks[:5])
+            # Объемы: суммируем столбец размеров без генератора по строкам
+            size_column = itemgetter(1)
+            total_bid_volume = sum(map(float, map(size_column, bids[:5])))
+            total_ask_volume = sum(map(float, map(size_column, asks[:5])))
             metrics["total_bid_volume"] = total_bid_volume
             metrics["total_ask_volume"] = total_ask_volume
             metrics["total_volume"] = total_bid_volume + total_ask_volume
@@ -330,20 +447,11 @@ class DataProcessor:
         
         # Дефолтные периоды
         if periods is None:
-            periods = {
-                "rsi": 14,
-                "sma_short": 9,
-                "sma_long": 21,
-                "ema_short": 12,
-                "ema_long": 26,
-                "bb_period": 20
-            }
+            periods = DEFAULT_INDICATOR_PERIODS
         
         indicators = {}
+        # Индикаторам нужен только столбец закрытий; high/low не используются, объем - только последний
         closes = [k["close"] for k in klines]
-        highs = [k["high"] for k in klines]
-        lows = [k["low"] for k in klines]
-        volumes = [k["volume"] for k in klines]
         
         try:
             # RSI
@@ -377,7 +485,7 @@ class DataProcessor:
             
             # Текущие значения
             indicators["current_price"] = closes[-1]
-            indicators["current_volume"] = volumes[-1] if volumes else 0
+            indicators["current_volume"] = klines[-1]["volume"]
             
             # Волатильность
             if len(closes) >= 20:
@@ -388,6 +496,98 @@ class DataProcessor:
         
         return indicators
     
+    def update_indicators(self, state: IndicatorState, kline: Dict) -> Dict:
+        """Инкрементальное обновление индикаторов по новой подтвержденной свече"""
+        try:
+            # Повторная свеча с тем же или более старым timestamp игнорируется
+            timestamp = kline["timestamp"]
+            if state.last_timestamp is not None and timestamp <= state.last_timestamp:
+                return state.snapshot()
+            
+            close = kline["close"]
+            periods = state.periods
+            previous_close = state.last_close
+            
+            state.last_timestamp = timestamp
+            state.last_close = close
+            state.last_volume = kline["volume"]
+            state.count += 1
+            
+            # EMA: затравка - SMA первых period закрытий (как в _calculate_ema), далее O(1) обновление
+            for key in ("ema_short", "ema_long"):
+                period = periods[key]
+                previous = state.ema[key]
+                if previous is None:
+                    state.ema_seed[key] += close
+                    if state.count == period:
+                        state.ema[key] = state.ema_seed[key] / period
+                else:
+                    multiplier = 2 / (period + 1)
+                    state.ema[key] = (close * multiplier) + (previous * (1 - multiplier))
+            
+            # Скользящие окна: вытесненное значение вычитается из сумм, пересчета по окну нет
+            for window in (state.sma_short, state.sma_long, state.bb, state.volatility):
+                window.push(close)
+            
+            if previous_close is not None:
+                change = close - previous_close
+                state.gains.push(change if change > 0 else 0.0)
+                state.losses.push(-change if change < 0 else 0.0)
+            
+            indicators = {}
+            
+            # RSI (простое среднее приростов/падений за период, как в _calculate_rsi)
+            if state.gains.full():
+                avg_loss = state.losses.total / periods["rsi"]
+                if avg_loss <= 0:
+                    indicators["rsi"] = 100.0
+                else:
+                    rs = (state.gains.total / periods["rsi"]) / avg_loss
+                    indicators["rsi"] = 100 - (100 / (1 + rs))
+            
+            # Moving Averages
+            if state.sma_short.full():
+                indicators["sma_short"] = state.sma_short.mean()
+            
+            if state.sma_long.full():
+                indicators["sma_long"] = state.sma_long.mean()
+            
+            if state.count >= periods["ema_short"]:
+                indicators["ema_short"] = state.ema["ema_short"]
+            
+            if state.count >= periods["ema_long"]:
+                indicators["ema_long"] = state.ema["ema_long"]
+            
+            # MACD
+            if "ema_short" in indicators and "ema_long" in indicators:
+                macd_line = indicators["ema_short"] - indicators["ema_long"]
+                indicators["macd"] = macd_line
+                indicators["macd_signal"] = macd_line * 0.9  # Упрощенная signal line
+                indicators["macd_histogram"] = indicators["macd"] - indicators["macd_signal"]
+            
+            # Bollinger Bands
+            if state.bb.full():
+                middle = state.bb.mean()
+                band = state.bb.std() * 2
+                indicators["bb_upper"] = middle + band
+                indicators["bb_middle"] = middle
+                indicators["bb_lower"] = middle - band
+            
+            # Текущие значения
+            indicators["current_price"] = close
+            indicators["current_volume"] = state.last_volume
+            
+            # Волатильность
+            if state.volatility.full():
+                indicators["volatility"] = (state.volatility.std() / state.volatility.mean()) * 100
+            
+            state._snapshot = indicators
+            
+        except Exception as e:
+            self.logger.error(f"Ошибка инкрементального обновления индикаторов: {e}")
+        
+        return state.snapshot()
+    
     def _calculate_rsi(self, prices: List[float], period: int) -> float:
         """Расчет RSI"""
         if len(prices) < period + 1:
@@ -428,14 +628,14 @@ class DataProcessor:
         if len(prices) < period:
             return 0.0
         
+        # Затравка - SMA первых period цен, как в потоковом update_indicators: на одном ряду значения совпадают
         multiplier = 2 / (period + 1)
-        ema_values = [prices[0]]
+        ema_value = sum(prices[:period]) / period
         
-        for price in prices[1:]:
-            ema_value = (price * multiplier) + (ema_values[-1] * (1 - multiplier))
-            ema_values.append(ema_value)
+        for price in prices[period:]:
+            ema_value = (price * multiplier) + (ema_value * (1 - multiplier))
         
-        return ema_values[-1]
+        return ema_value
     
     def _calculate_bollinger_bands(self, prices: List[float], period: int, std_dev: int = 2) -> Dict:
         """Bollinger Bands"""
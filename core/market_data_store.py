@@ -4,10 +4,29 @@ In-memory хранилище рыночных данных
 """
 
 import logging
+import sys
 from datetime import datetime, timedelta
 from typing import Dict, List, Optional, Any
-from collections import deque
+from collections import deque, namedtuple
+from itertools import islice
 from threading import Lock
+from types import MappingProxyType
+
+from core.data_processor import Kline, _RecordAccess, normalize_side
+
+
+class Trade(_RecordAccess, namedtuple("Trade", (
+    "symbol", "trade_id", "timestamp", "price", "size",
+    "side", "value", "processed_at", "data_source"
+))):
+    """Компактная запись сделки; t["size"] и t.get() сохранены для читателей, ожидающих dict"""
+    __slots__ = ()
+
+# Компактная строка истории orderbook (tuple вместо dict из 7 ключей)
+OrderbookHistoryRow = namedtuple("OrderbookHistoryRow", (
+    "timestamp", "spread", "best_bid", "best_ask",
+    "total_bid_volume", "total_ask_volume", "order_imbalance"
+))
 
 
 class MarketDataStore:
@@ -27,8 +46,15 @@ class MarketDataStore:
         self._orderbook = None
         self._trades = deque(maxlen=max_trades)
         
+        # Скользящее окно последних сделок для market stats с инкрементальными счетчиками
+        self._stats_window = deque(maxlen=100)
+        self._side_counts = {"BUY": 0, "SELL": 0}
+        self._side_volumes = {"BUY": 0.0, "SELL": 0.0}
+        self._window_volume = 0.0
+        
         # История
         self._orderbook_history = deque(maxlen=max_orderbook_history)
+        self._last_ob_sig = None  # (spread, order_imbalance) последней записи истории
         
         # Агрегированные данные
         self._market_stats = {}
@@ -45,21 +71,39 @@ class MarketDataStore:
     def add_kline(self, kline: Dict) -> bool:
         """Добавление kline данных"""
         try:
+            kline = self._make_kline(kline)
+            # Время обработки записи (время кадра WebSocket) вместо отдельного datetime.now()
+            updated_at = kline.processed_at or datetime.now()
             with self._lock:
                 # Проверяем, не дубликат ли это
-                if self._klines and self._klines[-1].get("timestamp") == kline.get("timestamp"):
+                if self._klines and self._klines[-1].timestamp == kline.timestamp:
                     # Обновляем последнюю свечу если она не подтверждена
-                    if not kline.get("confirm", False):
+                    if not kline.confirm:
                         self._klines[-1] = kline
-                        self._last_update["klines"] = datetime.now()
+                        self._last_update["klines"] = updated_at
                         return True
                     return False
                 
                 # Добавляем новую свечу только если она подтверждена
-                if kline.get("confirm", False):
+                if kline.confirm:
                     self._klines.append(kline)
-                    self._last_update["klines"] = datetime.now()
-                    self._update_price_levels(kline)
+                    self._last_update["klines"] = updated_at
+                    
+                    # Уровни поддержки/сопротивления: один проход по хвосту буфера
+                    if len(self._klines) >= 3:
+                        high_price = kline.high
+                        low_price = kline.low
+                        window_high = window_low = None
+                        for k in islice(reversed(self._klines), 5):
+                            if window_high is None or k.high > window_high:
+                                window_high = k.high
+                            if window_low is None or k.low < window_low:
+                                window_low = k.low
+                        
+                        if high_price == window_high:
+                            self._add_price_level("resistance", high_price, kline.timestamp)
+                        if low_price == window_low:
+                            self._add_price_level("support", low_price, kline.timestamp)
                     return True
                 else:
                     # Обновляем последнюю неподтвержденную свечу
@@ -67,7 +111,7 @@ class MarketDataStore:
                         self._klines[-1] = kline
                     else:
                         self._klines.append(kline)
-                    self._last_update["klines"] = datetime.now()
+                    self._last_update["klines"] = updated_at
                     return True
                     
         except Exception as e:
@@ -79,7 +123,7 @@ class MarketDataStore:
         try:
             with self._lock:
                 self._ticker = ticker
-                self._last_update["ticker"] = datetime.now()
+                self._last_update["ticker"] = ticker.get("processed_at") or datetime.now()
                 return True
                 
         except Exception as e:
@@ -90,21 +134,44 @@ class MarketDataStore:
         """Обновление orderbook данных"""
         try:
             with self._lock:
+                spread = orderbook.get("spread", 0)
+                imbalance = orderbook.get("order_imbalance", 0)
+                
                 # Сохраняем в историю если есть значительные изменения
-                if self._should_save_orderbook_history(orderbook):
-                    self._orderbook_history.append({
-                        "timestamp": orderbook.get("timestamp"),
-                        "spread": orderbook.get("spread", 0),
-                        "best_bid": orderbook.get("best_bid", 0),
-                        "best_ask": orderbook.get("best_ask", 0),
-                        "total_bid_volume": orderbook.get("total_bid_volume", 0),
-                        "total_ask_volume": orderbook.get("total_ask_volume", 0),
-                        "order_imbalance": orderbook.get("order_imbalance", 0)
-                    })
+                if self._should_save_orderbook_history(spread, imbalance):
+                    self._orderbook_history.append(OrderbookHistoryRow(
+                        orderbook.get("timestamp"),
+                        spread,
+                        orderbook.get("best_bid", 0),
+                        orderbook.get("best_ask", 0),
+                        orderbook.get("total_bid_volume", 0),
+                        orderbook.get("total_ask_volume", 0),
+                        imbalance
+                    ))
+                    self._last_ob_sig = (spread, imbalance)
                 
                 self._orderbook = orderbook
-                self._last_update["orderbook"] = datetime.now()
-                self._update_volume_profile(orderbook)
+                self._last_update["orderbook"] = orderbook.get("processed_at") or datetime.now()
+                
+                # Профиль объема: топ-10 уровней каждой стороны за один проход
+                profile = self._volume_profile
+                for levels, side_key in ((orderbook.get("bids", []), "bid_volume"),
+                                         (orderbook.get("asks", []), "ask_volume")):
+                    for level in islice(levels, 10):
+                        price = round(float(level[0]), 2)
+                        volume = float(level[1])
+                        
+                        entry = profile.get(price)
+                        if entry is None:
+                            entry = profile[price] = {"bid_volume": 0, "ask_volume": 0, "total_volume": 0}
+                        entry[side_key] += volume
+                        entry["total_volume"] += volume
+                
+                # Ограничиваем размер профиля объема
+                if len(profile) > 200:
+                    # Оставляем топ 100 по объему
+                    sorted_levels = sorted(profile.items(), key=lambda x: x[1]["total_volume"], reverse=True)
+                    self._volume_profile = dict(sorted_levels[:100])
                 return True
                 
         except Exception as e:
@@ -115,10 +182,13 @@ class MarketDataStore:
         """Добавление trade данных"""
         try:
             with self._lock:
+                record = None
                 for trade in trades:
-                    self._trades.append(trade)
+                    record = self._make_trade(trade)
+                    self._trades.append(record)
+                    self._push_stats_window(record)
                 
-                self._last_update["trades"] = datetime.now()
+                self._last_update["trades"] = (record.processed_at if record else None) or datetime.now()
                 self._update_market_stats()
                 return True
                 
@@ -133,12 +203,12 @@ class MarketDataStore:
                 klines = list(self._klines)
                 
                 if confirmed_only:
-                    klines = [k for k in klines if k.get("confirm", False)]
+                    klines = [k for k in klines if k.confirm]
                 
                 if limit:
                     klines = klines[-limit:]
                 
-                return klines
+                return [k._asdict() for k in klines]
                 
         except Exception as e:
             self.logger.error(f"Ошибка получения klines: {e}")
@@ -173,34 +243,54 @@ class MarketDataStore:
                 if limit:
                     trades = trades[-limit:]
                 
-                return trades
+                return [t._asdict() for t in trades]
                 
         except Exception as e:
             self.logger.error(f"Ошибка получения trades: {e}")
             return []
     
-    def get_market_summary(self) -> Dict:
-        """Получение сводки рыночных данных"""
+    def get_orderbook_history(self, limit: Optional[int] = None) -> List[Dict]:
+        """Получение истории orderbook"""
+        try:
+            with self._lock:
+                history = list(self._orderbook_history)
+            
+            if limit:
+                history = history[-limit:]
+            
+            return [row._asdict() for row in history]
+            
+        except Exception as e:
+            self.logger.error(f"Ошибка получения orderbook history: {e}")
+            return []
+    
+    def get_market_summary(self, immutable: bool = False) -> Dict:
+        """Получение сводки рыночных данных (immutable=True - только для внутреннего анализа, не для JSON)"""
         try:
             with self._lock:
-                summary = {
-                    "basic_market": self._ticker.copy() if self._ticker else {},
-                    "recent_klines": list(self._klines)[-20:] if self._klines else [],
-                    "orderbook": self._orderbook.copy() if self._orderbook else {},
-                    "recent_trades": list(self._trades)[-50:] if self._trades else [],
-                    "market_stats": self._market_stats.copy(),
-                    "price_levels": self._price_levels.copy(),
-                    "volume_profile": dict(list(self._volume_profile.items())[:20]),  # Топ 20
-                    "metadata": {
-                        "last_updates": self._last_update.copy(),
-                        "data_counts": {
-                            "klines": len(self._klines),
-                            "trades": len(self._trades),
-                            "orderbook_history": len(self._orderbook_history)
-                        },
-                        "data_quality": self._data_quality.copy(),
-                        "generated_at": datetime.now().isoformat()
+                if immutable:
+                    summary = self._build_summary_views()
+                else:
+                    # Сериализуемая форма: записи свечей и сделок как dict
+                    summary = {
+                        "basic_market": self._ticker.copy() if self._ticker else {},
+                        "recent_klines": [k._asdict() for k in islice(self._klines, max(len(self._klines) - 20, 0), None)],
+                        "orderbook": self._orderbook.copy() if self._orderbook else {},
+                        "recent_trades": [t._asdict() for t in islice(self._trades, max(len(self._trades) - 50, 0), None)],
+                        "market_stats": self._market_stats.copy(),
+                        "price_levels": self._price_levels.copy(),
+                        "volume_profile": dict(list(self._volume_profile.items())[:20]),  # Топ 20
                     }
+                
+                summary["metadata"] = {
+                    "last_updates": self._last_update.copy(),
+                    "data_counts": {
+                        "klines": len(self._klines),
+                        "trades": len(self._trades),
+                        "orderbook_history": len(self._orderbook_history)
+                    },
+                    "data_quality": self._data_quality.copy(),
+                    "generated_at": datetime.now().isoformat()
                 }
                 
                 return summary
@@ -209,6 +299,25 @@ class MarketDataStore:
             self.logger.error(f"Ошибка получения market summary: {e}")
             return {}
     
+    def _build_summary_views(self) -> Dict:
+        """Сводка без копирования для внутреннего анализа (вызывается под self._lock)"""
+        # ticker/orderbook/market_stats заменяются целиком при обновлении,
+        # поэтому proxy на текущий объект остается согласованным снимком
+        return {
+            "basic_market": MappingProxyType(self._ticker) if self._ticker else MappingProxyType({}),
+            # Записи Kline/Trade (r["close"], r.get()) - JSON-энкодер отдал бы их списками,
+            # поэтому эта сводка не уходит в API; сериализуемая форма - get_market_summary()
+            "recent_klines": tuple(islice(self._klines, max(len(self._klines) - 20, 0), None)),
+            "orderbook": MappingProxyType(self._orderbook) if self._orderbook else MappingProxyType({}),
+            "recent_trades": tuple(islice(self._trades, max(len(self._trades) - 50, 0), None)),
+            "market_stats": MappingProxyType(self._market_stats),
+            "price_levels": MappingProxyType({
+                "support": tuple(self._price_levels["support"]),
+                "resistance": tuple(self._price_levels["resistance"])
+            }),
+            "volume_profile": MappingProxyType(dict(islice(self._volume_profile.items(), 20))),  # Топ 20
+        }
+    
     def get_data_quality_report(self) -> Dict:
         """Отчет о качестве данных"""
         try:
@@ -219,7 +328,7 @@ class MarketDataStore:
                     "data_freshness": {},
                     "data_counts": {
                         "klines": len(self._klines),
-                        "confirmed_klines": len([k for k in self._klines if k.get("confirm", False)]),
+                        "confirmed_klines": sum(1 for k in self._klines if k.confirm),
                         "trades": len(self._trades),
                         "orderbook_history": len(self._orderbook_history)
                     },
@@ -257,126 +366,105 @@ class MarketDataStore:
             self.logger.error(f"Ошибка получения data quality report: {e}")
             return {}
     
-    def _should_save_orderbook_history(self, new_orderbook: Dict) -> bool:
+    def _should_save_orderbook_history(self, spread: float, imbalance: float) -> bool:
         """Определяет, стоит ли сохранять orderbook в историю"""
-        if not self._orderbook_history:
+        last = self._last_ob_sig
+        if last is None:
             return True
         
-        last_entry = self._orderbook_history[-1]
+        last_spread, last_imbalance = last
         
         # Сохраняем если изменился спред на > 5% или дисбаланс на > 10%
-        try:
-            spread_change = abs(new_orderbook.get("spread", 0) - last_entry["spread"]) / max(last_entry["spread"], 0.0001)
-            imbalance_change = abs(new_orderbook.get("order_imbalance", 0) - last_entry["order_imbalance"])
-            
-            return spread_change > 0.05 or imbalance_change > 0.1
-            
-        except Exception:
-            return True
+        spread_change = abs(spread - last_spread) / max(last_spread, 0.0001)
+        return spread_change > 0.05 or abs(imbalance - last_imbalance) > 0.1
     
-    def _update_price_levels(self, kline: Dict):
-        """Обновление уровней поддержки и сопротивления"""
-        try:
-            high_price = kline["high"]
-            low_price = kline["low"]
-            
-            # Простое определение уровней по локальным экстремумам
-            recent_klines = list(self._klines)[-5:] if len(self._klines) >= 5 else list(self._klines)
-            
-            if len(recent_klines) >= 3:
-                recent_highs = [k["high"] for k in recent_klines]
-                recent_lows = [k["low"] for k in recent_klines]
-                
-                # Локальный максимум
-                if high_price == max(recent_highs):
-                    self._price_levels["resistance"].append({
-                        "price": high_price,
-                        "timestamp": kline["timestamp"],
-                        "strength": 1,
-                        "touches": 1
-                    })
-                
-                # Локальный минимум
-                if low_price == min(recent_lows):
-                    self._price_levels["support"].append({
-                        "price": low_price,
-                        "timestamp": kline["timestamp"],
-                        "strength": 1,
-                        "touches": 1
-                    })
-            
-            # Ограничиваем количество уровней
-            self._price_levels["resistance"] = self._price_levels["resistance"][-20:]
-            self._price_levels["support"] = self._price_levels["support"][-20:]
-            
-        except Exception as e:
-            self.logger.debug(f"Ошибка обновления price levels: {e}")
+    def _add_price_level(self, level_type: str, price: float, timestamp: int):
+        """Добавление уровня с ограничением до 20 последних"""
+        levels = self._price_levels[level_type]
+        levels.append({
+            "price": price,
+            "timestamp": timestamp,
+            "strength": 1,
+            "touches": 1
+        })
+        if len(levels) > 20:
+            del levels[0]
     
-    def _update_volume_profile(self, orderbook: Dict):
-        """Обновление профиля объема"""
-        try:
-            bids = orderbook.get("bids", [])
-            asks = orderbook.get("asks", [])
-            
-            for bid in bids[:10]:
-                price = round(float(bid[0]), 2)
-                volume = float(bid[1])
-                
-                if price not in self._volume_profile:
-                    self._volume_profile[price] = {"bid_volume": 0, "ask_volume": 0, "total_volume": 0}
-                
-                self._volume_profile[price]["bid_volume"] += volume
-                self._volume_profile[price]["total_volume"] += volume
-            
-            for ask in asks[:10]:
-                price = round(float(ask[0]), 2)
-                volume = float(ask[1])
-                
-                if price not in self._volume_profile:
-                    self._volume_profile[price] = {"bid_volume": 0, "ask_volume": 0, "total_volume": 0}
-                
-                self._volume_profile[price]["ask_volume"] += volume
-                self._volume_profile[price]["total_volume"] += volume
-            
-            # Ограичиваем размер профиля объема
-            if len(self._volume_profile) > 200:
-                # Оставляем топ 100 по объему
-                sorted_levels = sorted(self._volume_profile.items(), key=lambda x: x[1]["total_volume"], reverse=True)
-                self._volume_profile = dict(sorted_levels[:100])
-                
-        except Exception as e:
-            self.logger.debug(f"Ошибка обновления volume profile: {e}")
+    @staticmethod
+    def _make_kline(kline) -> Kline:
+        """Свеча из DataProcessor уже Kline; dict нормализуется в запись (отсутствующие поля -> None)"""
+        if kline.__class__ is Kline:
+            return kline
+        return Kline._make(map(kline.get, Kline._fields))
+    
+    def _make_trade(self, trade: Dict) -> Trade:
+        """Нормализация сделки в компактную запись при сохранении"""
+        return Trade(
+            trade["symbol"],
+            trade.get("trade_id", ""),
+            trade["timestamp"],
+            trade["price"],
+            trade["size"],
+            normalize_side(trade["side"]),
+            trade.get("value", trade["price"] * trade["size"]),
+            trade.get("processed_at"),
+            trade.get("data_source", "websocket")
+        )
+    
+    def _push_stats_window(self, trade: Trade):
+        """Сдвиг окна статистики: вычитаем вытесняемую сделку, добавляем новую"""
+        window = self._stats_window
+        if len(window) == window.maxlen:
+            evicted = window[0]
+            self._window_volume -= evicted.size
+            if evicted.side in self._side_counts:
+                self._side_counts[evicted.side] -= 1
+                self._side_volumes[evicted.side] -= evicted.size
+        
+        window.append(trade)
+        self._window_volume += trade.size
+        if trade.side in self._side_counts:
+            self._side_counts[trade.side] += 1
+            self._side_volumes[trade.side] += trade.size
+    
+    def _rebuild_stats_window(self):
+        """Пересборка окна статистики из хранилища сделок (после очистки)"""
+        self._stats_window.clear()
+        self._side_counts = {"BUY": 0, "SELL": 0}
+        self._side_volumes = {"BUY": 0.0, "SELL": 0.0}
+        self._window_volume = 0.0
+        
+        start = max(len(self._trades) - self._stats_window.maxlen, 0)
+        for trade in islice(self._trades, start, None):
+            self._push_stats_window(trade)
     
     def _update_market_stats(self):
-        """Обновление рыночной статистики"""
+        """Обновление рыночной статистики по счетчикам окна последних сделок"""
         try:
-            if not self._trades:
+            window = self._stats_window
+            if not window:
+                self._market_stats = {}
                 return
             
-            # Анализ последних сделок
-            recent_trades = list(self._trades)[-100:]
+            buy_count = self._side_counts["BUY"]
+            sell_count = self._side_counts["SELL"]
+            buy_volume = self._side_volumes["BUY"]
+            sell_volume = self._side_volumes["SELL"]
+            total_volume = self._window_volume
             
-            if recent_trades:
-                buy_trades = [t for t in recent_trades if t["side"].upper() == "BUY"]
-                sell_trades = [t for t in recent_trades if t["side"].upper() == "SELL"]
-                
-                total_volume = sum(t["size"] for t in recent_trades)
-                buy_volume = sum(t["size"] for t in buy_trades)
-                sell_volume = sum(t["size"] for t in sell_trades)
-                
-                self._market_stats = {
-                    "total_trades": len(recent_trades),
-                    "buy_trades": len(buy_trades),
-                    "sell_trades": len(sell_trades),
-                    "buy_sell_ratio": len(buy_trades) / max(len(sell_trades), 1),
-                    "total_volume": total_volume,
-                    "buy_volume": buy_volume,
-                    "sell_volume": sell_volume,
-                    "volume_imbalance": (buy_volume - sell_volume) / max(total_volume, 1),
-                    "avg_trade_size": total_volume / len(recent_trades),
-                    "last_trade_price": recent_trades[-1]["price"] if recent_trades else 0,
-                    "updated_at": datetime.now().isoformat()
-                }
+            self._market_stats = {
+                "total_trades": len(window),
+                "buy_trades": buy_count,
+                "sell_trades": sell_count,
+                "buy_sell_ratio": buy_count / max(sell_count, 1),
+                "total_volume": total_volume,
+                "buy_volume": buy_volume,
+                "sell_volume": sell_volume,
+                "volume_imbalance": (buy_volume - sell_volume) / max(total_volume, 1),
+                "avg_trade_size": total_volume / len(window),
+                "last_trade_price": window[-1].price,
+                "updated_at": datetime.now().isoformat()
+            }
                 
         except Exception as e:
             self.logger.debug(f"Ошибка обновления market stats: {e}")
@@ -390,21 +478,25 @@ class MarketDataStore:
                 
                 # Очищаем старые klines
                 self._klines = deque(
-                    [k for k in self._klines if k.get("timestamp", 0) > cutoff_timestamp],
+                    [k for k in self._klines if (k.timestamp or 0) > cutoff_timestamp],
                     maxlen=self.max_klines
                 )
                 
                 # Очищаем старые trades
                 self._trades = deque(
-                    [t for t in self._trades if t.get("timestamp", 0) > cutoff_timestamp],
+                    [t for t in self._trades if (t.timestamp or 0) > cutoff_timestamp],
                     maxlen=self.max_trades
                 )
+                self._rebuild_stats_window()
+                self._update_market_stats()
                 
                 # Очищаем старую историю orderbook
                 self._orderbook_history = deque(
-                    [o for o in self._orderbook_history if o.get("timestamp", 0) > cutoff_timestamp],
+                    [o for o in self._orderbook_history if (o.timestamp or 0) > cutoff_timestamp],
                     maxlen=self.max_orderbook_history
                 )
+                if not self._orderbook_history:
+                    self._last_ob_sig = None
                 
                 # Очищаем старые price levels
                 for level_type in ["support", "resistance"]:
@@ -421,27 +513,54 @@ class MarketDataStore:
     def get_memory_usage(self) -> Dict:
         """Получение информации об использовании памяти"""
         try:
-            import sys
-            
-            return {
-                "klines": {
-                    "count": len(self._klines),
-                    "memory_bytes": sys.getsizeof(self._klines)
-                },
-                "trades": {
-                    "count": len(self._trades),
-                    "memory_bytes": sys.getsizeof(self._trades)
-                },
-                "orderbook_history": {
-                    "count": len(self._orderbook_history),
-                    "memory_bytes": sys.getsizeof(self._orderbook_history)
-                },
-                "volume_profile": {
-                    "levels": len(self._volume_profile),
-                    "memory_bytes": sys.getsizeof(self._volume_profile)
+            with self._lock:
+                usage = {
+                    "klines": {
+                        "count": len(self._klines),
+                        "memory_bytes": self._estimate_retained_bytes(self._klines)
+                    },
+                    "trades": {
+                        "count": len(self._trades),
+                        "memory_bytes": self._estimate_retained_bytes(self._trades)
+                    },
+                    "orderbook_history": {
+                        "count": len(self._orderbook_history),
+                        "memory_bytes": self._estimate_retained_bytes(self._orderbook_history)
+                    },
+                    "volume_profile": {
+                        "levels": len(self._volume_profile),
+                        "memory_bytes": self._estimate_volume_profile_bytes()
+                    }
                 }
-            }
+            
+            usage["total_bytes"] = sum(item["memory_bytes"] for item in usage.values())
+            return usage
             
         except Exception as e:
             self.logger.error(f"Ошибка получения memory usage: {e}")
             return {}
+    
+    @staticmethod
+    def _estimate_record_bytes(record) -> int:
+        """Размер одной записи вместе с ее значениями (dict или namedtuple)"""
+        values = record.values() if isinstance(record, dict) else record
+        return sys.getsizeof(record) + sum(sys.getsizeof(v) for v in values)
+    
+    def _estimate_retained_bytes(self, container) -> int:
+        """Оценка удерживаемой памяти: сам контейнер + элементы по образцу последнего"""
+        size = sys.getsizeof(container)
+        if not container:
+            return size
+        
+        # Записи однородны, поэтому достаточно одного образца вместо обхода всех
+        return size + self._estimate_record_bytes(container[-1]) * len(container)
+    
+    def _estimate_volume_profile_bytes(self) -> int:
+        """Оценка памяти профиля объема: ключи-цены и вложенные dict уровней"""
+        size = sys.getsizeof(self._volume_profile)
+        if not self._volume_profile:
+            return size
+        
+        price, level = next(iter(self._volume_profile.items()))
+        per_level = sys.getsizeof(price) + self._estimate_record_bytes(level)
+        return size + per_level * len(self._volume_profile)
@@ -5,18 +5,53 @@
 
 import asyncio
 import logging
+import time
 from datetime import datetime
-from typing import Dict, List, Optional, Callable, Any
+from types import MappingProxyType
+from typing import Dict, List, Optional, Callable, Any, Tuple
+
+# Event loop выбирает точка входа приложения (main.py); здесь uvloop нужен только для диагностики в start()
+try:
+    import uvloop
+    UVLOOP_AVAILABLE = True
+except ImportError:
+    UVLOOP_AVAILABLE = False
 
 from core.pybit_websocket import PybitWebSocket
-from core.data_processor import DataProcessor
+from core.data_processor import DataProcessor, IndicatorState, ts_to_datetime
 from core.market_data_store import MarketDataStore
 from core.signal_processor import SignalProcessor
 
+# Предсобранные форматтеры для get_market_data
+_PRICE_FMT = "{:.4f}".format
+_PCT_FMT = "{:+.2f}%".format
+_VOL_FMT = "{:,.0f}".format
+
+
+def _read_only(value: Any) -> Any:
+    """Read-only копия структуры для TTL-кэшей: dict -> MappingProxyType, list -> tuple (рекурсивно)"""
+    # Кэшированный ответ отдается всем вызывающим - изменение одним не портит данные остальным
+    if isinstance(value, (dict, MappingProxyType)):
+        return MappingProxyType({key: _read_only(item) for key, item in value.items()})
+    if isinstance(value, list):
+        return tuple(_read_only(item) for item in value)
+    return value
+
 
 class MarketManager:
     """Главный координатор рыночных данных"""
     
+    __slots__ = (
+        "symbol", "on_signal_callback",
+        "websocket", "data_processor", "data_store", "signal_processor",
+        "is_running", "last_analysis_time",
+        "_pending_analysis", "_analysis_task", "_loop",
+        "_ingress", "_consumer_task", "_latest", "_dispatch",
+        "_ai_cache", "_ai_cache_ttl", "_comp_cache", "_indicator_state", "_iso_now", "_iso_now_ts",
+        "_status_cache", "_md_cache",
+        "logger", "_debug"
+    )
+    
     def __init__(self, symbol: str, on_signal_callback: Optional[Callable] = None):
         self.symbol = symbol
         self.on_signal_callback = on_signal_callback
@@ -31,9 +66,40 @@ class MarketManager:
         self.is_running = False
         self.last_analysis_time = None
         
+        # Коалесцированный анализ сигналов (не чаще одного прогона за раз)
+        self._pending_analysis = False
+        self._analysis_task: Optional[asyncio.Task] = None
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        
+        # Входная очередь WebSocket событий (callbacks только кладут, обработка - в _consume)
+        self._ingress: asyncio.Queue = asyncio.Queue(maxsize=4096)
+        self._consumer_task: Optional[asyncio.Task] = None
+        # Последние необработанные снимки: в очереди лежит только маркер, данные берутся свежие
+        self._latest: Dict[str, Optional[Dict]] = {"ticker": None, "orderbook": None}
+        
+        # Кэши для ИИ-запросов (сбрасываются на подтвержденной свече)
+        self._ai_cache: Optional[Tuple[float, Dict]] = None
+        self._ai_cache_ttl = 1.0
+        self._comp_cache: Optional[Tuple[float, Dict]] = None  # comprehensive data вместе с REST
+        self._indicator_state = IndicatorState()
+        self._iso_now = ""
+        self._iso_now_ts = 0.0
+        self._status_cache: Optional[Tuple[float, Dict]] = None  # полный статус, TTL 2 секунды
+        self._md_cache: Optional[Tuple[Any, Dict]] = None  # (processed_at тикера, отформатированные данные)
+        
+        self._dispatch: Dict[str, Callable] = {
+            "kline": self._process_kline,
+            "ticker": self._process_ticker,
+            "orderbook": self._process_orderbook,
+            "trades": self._process_trades
+        }
+        
         self.logger = logging.getLogger(__name__)
         self.logger.info(f"MarketManager инициализирован для {symbol}")
         
+        # Флаг DEBUG для горячих путей (обновляется в start)
+        self._debug = self.logger.isEnabledFor(logging.DEBUG)
+        
         # Настройка связей между компонентами
         self._setup_component_connections()
     
@@ -51,7 +117,61 @@ class MarketManager:
         if self.on_signal_callback:
             self.signal_processor.set_signal_callback(self._handle_generated_signal)
     
+    def _enqueue(self, kind: str, payload: Any) -> bool:
+        """Неблокирующая постановка события в очередь (при переполнении событие отбрасывается)"""
+        try:
+            self._ingress.put_nowait((kind, payload))
+            return True
+        except asyncio.QueueFull:
+            self.logger.warning(f"Очередь событий переполнена, {kind} отброшен")
+            return False
+    
     def _handle_kline(self, raw_kline: Dict):
+        """WebSocket callback: kline"""
+        self._enqueue("kline", raw_kline)
+    
+    def _enqueue_latest(self, kind: str, snapshot: Dict):
+        """Постановка снимка с заменой: пока маркер в очереди, новые снимки перезаписывают старый"""
+        pending = self._latest[kind] is not None
+        self._latest[kind] = snapshot
+        if not pending and not self._enqueue(kind, None):
+            self._latest[kind] = None
+    
+    def _handle_ticker(self, raw_ticker: Dict):
+        """WebSocket callback: ticker (необработанные снимки схлопываются до последнего)"""
+        self._enqueue_latest("ticker", raw_ticker)
+    
+    def _handle_orderbook(self, raw_orderbook: Dict):
+        """WebSocket callback: orderbook (необработанные снимки схлопываются до последнего)"""
+        self._enqueue_latest("orderbook", raw_orderbook)
+    
+    def _handle_trades(self, raw_trades: List[Dict]):
+        """WebSocket callback: trades"""
+        self._enqueue("trades", raw_trades)
+    
+    def _dispatch_event(self, kind: str, payload: Any):
+        """Передача события обработчику (маркер None - взять последний снимок)"""
+        if payload is None:
+            payload = self._latest[kind]
+            self._latest[kind] = None
+            if payload is None:
+                return
+        
+        self._dispatch[kind](payload)
+    
+    async def _consume(self):
+        """Обработка входной очереди событий в event loop"""
+        while self.is_running:
+            kind, payload = await self._ingress.get()
+            self._dispatch_event(kind, payload)
+    
+    def _drain_ingress(self):
+        """Обработка оставшихся в очереди событий при остановке"""
+        while not self._ingress.empty():
+            kind, payload = self._ingress.get_nowait()
+            self._dispatch_event(kind, payload)
+    
+    def _process_kline(self, raw_kline: Dict):
         """Обработка kline данных"""
         try:
             # Обрабатываем данные
@@ -62,16 +182,20 @@ class MarketManager:
             # Сохраняем в хранилище
             success = self.data_store.add_kline(processed_kline)
             if success:
-                self.logger.debug(f"Kline обработан: {processed_kline['close']:.4f} @ {processed_kline['datetime']}")
+                if self._debug:
+                    self.logger.debug("Kline обработан: %.4f @ %s", processed_kline['close'], ts_to_datetime(processed_kline['timestamp']))
                 
                 # Анализируем сигналы только для подтвержденных свечей
                 if processed_kline.get("confirm", False):
-                    self._check_for_trading_signals()
+                    self.data_processor.update_indicators(self._indicator_state, processed_kline)
+                    self._ai_cache = None
+                    self._comp_cache = None
+                    self._schedule_analysis()
             
         except Exception as e:
             self.logger.error(f"Ошибка обработки kline: {e}")
     
-    def _handle_ticker(self, raw_ticker: Dict):
+    def _process_ticker(self, raw_ticker: Dict):
         """Обработка ticker данных"""
         try:
             # Обрабатываем данные
@@ -82,12 +206,13 @@ class MarketManager:
             # Сохраняем в хранилище
             success = self.data_store.update_ticker(processed_ticker)
             if success:
-                self.logger.debug(f"Ticker обновлен: {processed_ticker['symbol']} @ ${processed_ticker['last_price']:.2f}")
+                if self._debug:
+                    self.logger.debug("Ticker обновлен: %s @ $%.2f", processed_ticker['symbol'], processed_ticker['last_price'])
             
         except Exception as e:
             self.logger.error(f"Ошибка обработки ticker: {e}")
     
-    def _handle_orderbook(self, raw_orderbook: Dict):
+    def _process_orderbook(self, raw_orderbook: Dict):
         """Обработка orderbook данных"""
         try:
             # Обрабатываем данные
@@ -97,13 +222,13 @@ class MarketManager:
             
             # Сохраняем в хранилище
             success = self.data_store.update_orderbook(processed_orderbook)
-            if success:
+            if success and self._debug:
                 self.logger.debug("Orderbook обновлен")
             
         except Exception as e:
             self.logger.error(f"Ошибка обработки orderbook: {e}")
     
-    def _handle_trades(self, raw_trades: List[Dict]):
+    def _process_trades(self, raw_trades: List[Dict]):
         """Обработка trade данных"""
         try:
             # Обрабатываем данные
@@ -114,27 +239,45 @@ class MarketManager:
             # Сохраняем в хранилище
             success = self.data_store.add_trades(processed_trades)
             if success:
-                self.logger.debug(f"Trades обновлены: +{len(processed_trades)}")
+                if self._debug:
+                    self.logger.debug("Trades обновлены: +%d", len(processed_trades))
             
         except Exception as e:
             self.logger.error(f"Ошибка обработки trades: {e}")
     
+    def _schedule_analysis(self):
+        """Отметить необходимость анализа и запустить drain-задачу, если она не активна"""
+        self._pending_analysis = True
+        
+        if self._analysis_task is None or self._analysis_task.done():
+            self._analysis_task = asyncio.get_running_loop().create_task(self._drain_analysis())
+    
+    async def _drain_analysis(self):
+        """Выполнение анализа в event loop (индикаторы инкрементальные - прогон дешевый)"""
+        # SignalProcessor трогается только из потока event loop - его состояние не требует блокировок.
+        # Подтверждения, пришедшие во время прогона, сливаются в один следующий прогон
+        while self._pending_analysis:
+            self._pending_analysis = False
+            self._check_for_trading_signals()
+            # Уступаем цикл: очередь событий обрабатывается между прогонами
+            await asyncio.sleep(0)
+    
     def _check_for_trading_signals(self):
         """Проверка условий для генерации торговых сигналов"""
         try:
-            # Получаем полные рыночные данные
-            market_data = self.data_store.get_market_summary()
+            # Получаем полные рыночные данные (только чтение - без копий)
+            market_data = self.data_store.get_market_summary(immutable=True)
             if not market_data:
                 return
             
             # Валидируем условия для анализа
             validation = self.signal_processor.validate_signal_conditions(market_data)
             if not validation.get("can_generate_signals", False):
-                self.logger.debug(f"Сигналы не могут быть сгенерированы: {validation.get('issues', [])}")
+                self.logger.debug("Сигналы не могут быть сгенерированы: %s", validation.get("issues", []))
                 return
             
             # Анализируем рыночные условия
-            signal = self.signal_processor.analyze_market_data(market_data)
+            signal = self._run_signal_analysis(market_data)
             if signal:
                 self.logger.info(f"Сгенерирован торговый сигнал: {signal.signal_type} {signal.symbol}")
                 self.last_analysis_time = datetime.now()
@@ -142,25 +285,31 @@ class MarketManager:
         except Exception as e:
             self.logger.error(f"Ошибка проверки торговых сигналов: {e}")
     
+    def _run_signal_analysis(self, market_data: Dict):
+        """Единая точка входа в анализ SignalProcessor (только из потока event loop)"""
+        return self.signal_processor.analyze_market_data(market_data, self._get_technical_indicators())
+    
+    @staticmethod
+    def _signal_payload(signal) -> Dict:
+        """Плоский dict сигнала для внешних потребителей (без глубокого копирования indicators)"""
+        return {
+            "signal_id": signal.signal_id,
+            "symbol": signal.symbol,
+            "signal_type": signal.signal_type,
+            "price": signal.price,
+            "confidence": signal.confidence,
+            "timestamp": signal.timestamp,
+            "reason": signal.reason,
+            "indicators": signal.indicators,
+            "timeframe": signal.timeframe
+        }
+    
     def _handle_generated_signal(self, signal):
         """Обработка сгенерированного сигнала"""
         try:
-            # Преобразуем signal в dict для callback
-            signal_dict = {
-                "signal_id": signal.signal_id,
-                "symbol": signal.symbol,
-                "signal_type": signal.signal_type,
-                "price": signal.price,
-                "confidence": signal.confidence,
-                "timestamp": signal.timestamp,
-                "reason": signal.reason,
-                "indicators": signal.indicators,
-                "timeframe": signal.timeframe
-            }
-            
-            # Вызываем внешний callback
-            if self.on_signal_callback:
-                asyncio.create_task(self.on_signal_callback(signal_dict))
+            # Вызываем внешний callback (анализ идет в event loop - задача создается напрямую)
+            if self.on_signal_callback and self._loop:
+                self._loop.create_task(self.on_signal_callback(self._signal_payload(signal)))
             
         except Exception as e:
             self.logger.error(f"Ошибка обработки сгенерированного сигнала: {e}")
@@ -174,10 +323,26 @@ class MarketManager:
             
             self.logger.info("Запуск MarketManager...")
             
-            # Запускаем WebSocket
-            await self.websocket.connect()
+            self._loop = asyncio.get_running_loop()
+            self._debug = self.logger.isEnabledFor(logging.DEBUG)
+            if not type(self._loop).__module__.startswith("uvloop"):
+                self.logger.warning(
+                    f"Event loop не uvloop ({type(self._loop).__module__}), "
+                    f"uvloop {'установлен' if UVLOOP_AVAILABLE else 'не установлен'}"
+                )
             
+            # Запускаем обработчик очереди до подключения, чтобы не терять первые события
             self.is_running = True
+            self._consumer_task = self._loop.create_task(self._consume())
+            
+            # Запускаем WebSocket
+            try:
+                await self.websocket.connect()
+            except Exception:
+                self.is_running = False
+                self._consumer_task.cancel()
+                raise
+            
             self.logger.info("MarketManager успешно запущен")
             
         except Exception as e:
@@ -197,6 +362,23 @@ class MarketManager:
             # Останавливаем WebSocket
             await self.websocket.disconnect()
             
+            # Останавливаем обработчик очереди
+            if self._consumer_task:
+                self._consumer_task.cancel()
+                try:
+                    await self._consumer_task
+                except asyncio.CancelledError:
+                    pass
+                self._consumer_task = None
+            
+            # WebSocket закрыт - новых событий не будет, дообрабатываем принятые
+            self._drain_ingress()
+            
+            # Дожидаемся текущего прогона анализа
+            if self._analysis_task and not self._analysis_task.done():
+                self._pending_analysis = False
+                await self._analysis_task
+            
             # Очищаем старые данные
             self.data_store.cleanup_old_data()
             self.signal_processor.clear_old_signals()
@@ -209,7 +391,7 @@ class MarketManager:
     # Публичные методы для получения данных
     
     def get_market_data(self, symbol: str = None) -> Dict:
-        """Получить базовые рыночные данные (совместимость со старым API)"""
+        """Получить базовые рыночные данные (совместимость со старым API, кэш до следующего тикера)"""
         if symbol and symbol != self.symbol:
             return {}
         
@@ -217,75 +399,101 @@ class MarketManager:
         if not ticker:
             return {}
         
-        return {
+        processed_at = ticker.get("processed_at")
+        if self._md_cache and processed_at is not None and self._md_cache[0] == processed_at:
+            return self._md_cache[1]
+        
+        market_data = {
             "symbol": ticker.get("symbol", self.symbol),
-            "price": f"{ticker.get('last_price', 0):.4f}",
-            "change_24h": f"{ticker.get('change_24h', 0):+.2f}%",
-            "volume_24h": f"{ticker.get('volume_24h', 0):,.0f}",
-            "high_24h": f"{ticker.get('high_24h', 0):.4f}",
-            "low_24h": f"{ticker.get('low_24h', 0):.4f}",
-            "timestamp": ticker.get("processed_at"),
+            "price": _PRICE_FMT(ticker.get("last_price", 0)),
+            "change_24h": _PCT_FMT(ticker.get("change_24h", 0)),
+            "volume_24h": _VOL_FMT(ticker.get("volume_24h", 0)),
+            "high_24h": _PRICE_FMT(ticker.get("high_24h", 0)),
+            "low_24h": _PRICE_FMT(ticker.get("low_24h", 0)),
+            "timestamp": processed_at,
             "data_source": "market_manager"
         }
+        
+        self._md_cache = (processed_at, market_data)
+        return market_data
     
     async def get_comprehensive_market_data(self, symbol: str = None) -> Dict:
-        """Получить полные рыночные данные для ИИ-анализа"""
+        """Получить полные рыночные данные для ИИ-анализа (кэш на self._ai_cache_ttl секунд, результат только для чтения)"""
         if symbol and symbol != self.symbol:
             return {}
         
         try:
+            now = time.monotonic()
+            if self._comp_cache and now - self._comp_cache[0] < self._ai_cache_ttl:
+                return self._comp_cache[1]
+            
             # Получаем данные из хранилища
             market_summary = self.data_store.get_market_summary()
             
             # Добавляем технические индикаторы
-            klines = self.data_store.get_klines(limit=50, confirmed_only=True)
-            if klines:
-                indicators = self.data_processor.calculate_technical_indicators(klines)
+            indicators = self._get_technical_indicators()
+            if indicators:
                 market_summary["technical_indicators"] = indicators
             
-            # Добавляем REST данные если нужно
-            rest_ticker = self.websocket.get_rest_ticker()
+            # Добавляем REST данные если нужно (оба запроса параллельно, вне event loop)
+            rest_ticker, rest_klines = await asyncio.gather(
+                self.websocket.get_rest_ticker_async(),
+                self.websocket.get_rest_klines_async(limit=20)
+            )
             if rest_ticker:
                 market_summary["rest_ticker"] = rest_ticker
             
-            rest_klines = self.websocket.get_rest_klines(limit=20)
             if rest_klines:
                 market_summary["rest_klines"] = rest_klines
             
+            # Один ответ (вместе с REST данными) отдается всем вызывающим в пределах TTL - только чтение
+            market_summary = _read_only(market_summary)
+            self._comp_cache = (now, market_summary)
             return market_summary
             
         except Exception as e:
             self.logger.error(f"Ошибка получения comprehensive market data: {e}")
             return {}
     
-    def get_connection_status(self) -> Dict:
-        """Получить статус подключения"""
-        websocket_status = self.websocket.get_connection_status()
-        data_quality = self.data_store.get_data_quality_report()
-        signal_stats = self.signal_processor.get_signal_statistics()
-        
+    def _basic_status(self) -> Dict:
+        """Дешевый статус без обхода хранилища"""
         return {
             "is_running": self.is_running,
-            "websocket": websocket_status,
-            "data_quality": data_quality,
-            "signal_processor": signal_stats,
-            "last_analysis_time": self.last_analysis_time.isoformat() if self.last_analysis_time else None,
-            "memory_usage": self.data_store.get_memory_usage()
+            "websocket": self.websocket.get_connection_status(),
+            "last_analysis_time": self.last_analysis_time.isoformat() if self.last_analysis_time else None
         }
     
+    def get_connection_status(self, full: bool = True) -> Dict:
+        """Получить статус подключения (full=False - только дешевая часть для частых опросов)"""
+        if not full:
+            return self._basic_status()
+        
+        # Полный статус (качество данных, статистика сигналов, память) кэшируется на 2 секунды
+        now = time.monotonic()
+        if self._status_cache and now - self._status_cache[0] < 2.0:
+            return self._status_cache[1]
+        
+        status = self._basic_status()
+        status["data_quality"] = self.data_store.get_data_quality_report()
+        status["signal_processor"] = self.signal_processor.get_signal_statistics()
+        status["memory_usage"] = self.data_store.get_memory_usage()
+        
+        self._status_cache = (now, status)
+        return status
+    
     def get_recent_signals(self, limit: int = 10) -> List[Dict]:
         """Получить последние сигналы"""
         return self.signal_processor.get_recent_signals(limit)
     
     def force_market_analysis(self) -> Optional[Dict]:
-        """Принудительный анализ рынка (для тестирования)"""
+        """Принудительный анализ рынка (для тестирования; вызывать из event loop, как и фоновый анализ)"""
         try:
-            market_data = self.data_store.get_market_summary()
+            market_data = self.data_store.get_market_summary(immutable=True)
             if not market_data:
                 return None
             
-            signal = self.signal_processor.analyze_market_data(market_data)
-            return signal._asdict() if signal else None
+            signal = self._run_signal_analysis(market_data)
+            return self._signal_payload(signal) if signal else None
             
         except Exception as e:
             self.logger.error(f"Ошибка принудительного анализа: {e}")
@@ -293,15 +501,30 @@ class MarketManager:
     
     # Методы для интеграции с ИИ-анализатором
     
+    def _get_technical_indicators(self) -> Dict:
+        """Индикаторы по подтвержденным свечам (обновляются инкрементально в _process_kline)"""
+        return self._indicator_state.snapshot()
+    
+    def _iso_now_cached(self) -> str:
+        """Текущее время в ISO формате, обновляется не чаще раза в секунду"""
+        now = time.monotonic()
+        if now - self._iso_now_ts > 1.0:
+            self._iso_now = datetime.now().isoformat()
+            self._iso_now_ts = now
+        return self._iso_now
+    
     def format_market_data_for_ai(self) -> Dict:
-        """Форматирование данных для ИИ-анализатора"""
+        """Форматирование данных для ИИ-анализатора (кэш на self._ai_cache_ttl секунд, результат только для чтения)"""
         try:
+            now = time.monotonic()
+            if self._ai_cache and now - self._ai_cache[0] < self._ai_cache_ttl:
+                return self._ai_cache[1]
+            
             market_summary = self.data_store.get_market_summary()
             
             # Добавляем технические индикаторы
-            klines = self.data_store.get_klines(limit=50, confirmed_only=True)
-            if klines:
-                indicators = self.data_processor.calculate_technical_indicators(klines)
+            indicators = self._get_technical_indicators()
+            if indicators:
                 market_summary["technical_indicators"] = indicators
             
             # Форматируем для ИИ-анализатора
@@ -314,13 +537,16 @@ class MarketManager:
                 "market_stats": market_summary.get("market_stats", {}),
                 "price_levels": market_summary.get("price_levels", {}),
                 "metadata": {
-                    "timestamp": datetime.now().isoformat(),
+                    "timestamp": self._iso_now_cached(),
                     "symbol": self.symbol,
                     "data_source": "market_manager",
                     "data_quality": self.data_store.get_data_quality_report()
                 }
             }
             
+            # Снимок индикаторов и вложенные структуры общие для всех попаданий в кэш - только чтение
+            formatted_data = _read_only(formatted_data)
+            self._ai_cache = (now, formatted_data)
             return formatted_data
             
         except Exception as e:
@@ -330,7 +556,7 @@ class MarketManager:
     def get_status_summary(self) -> str:
         """Получить краткую сводку статуса"""
         try:
-            status = self.get_connection_status()
+            status = self._basic_status()
             ticker = self.data_store.get_ticker()
             
             if not ticker:
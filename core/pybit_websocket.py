@@ -1,29 +1,131 @@
 """
-Чистый WebSocket менеджер на основе pybit
+Чистый WebSocket клиент Bybit на picows (нативный asyncio, без потоков pybit)
 ТОЛЬКО получение данных, БЕЗ бизнес-логики
 """
 
+import asyncio
+import heapq
 import logging
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime
-from typing import Dict, List, Optional, Callable, Any
+from functools import lru_cache
+from typing import Dict, List, Optional, Callable, Any, Tuple
 
-from pybit.unified_trading import WebSocket as PybitWebSocket, HTTP as PybitHTTP
+import orjson
+from picows import ws_connect, WSFrame, WSTransport, WSListener, WSMsgType, WSCloseCode
+from pybit.unified_trading import HTTP as PybitHTTP
 from config.settings import get_settings
 
+try:
+    import msgspec
+    MSGSPEC_AVAILABLE = True
+except ImportError:
+    MSGSPEC_AVAILABLE = False
+
+
+@lru_cache(maxsize=2)
+def _get_http(testnet: bool) -> PybitHTTP:
+    """Общий HTTP клиент pybit (один пул соединений на все символы)"""
+    return PybitHTTP(testnet=testnet)
+
+
+if MSGSPEC_AVAILABLE:
+    class _Envelope(msgspec.Struct):
+        """Оболочка сообщения Bybit: data остается сырыми байтами до выбора схемы по топику"""
+        topic: str = ""
+        type: str = ""
+        data: msgspec.Raw = msgspec.Raw(b"null")
+    
+    class _KlineMsg(msgspec.Struct):
+        """Свеча Bybit v5 (строковые цены приводятся к float парсером)"""
+        start: int
+        open: float
+        high: float
+        low: float
+        close: float
+        volume: float
+        confirm: bool
+        interval: str
+    
+    class _TradeMsg(msgspec.Struct):
+        """Сделка Bybit v5"""
+        T: int
+        p: float
+        v: float
+        S: str
+        i: str
+    
+    _ENVELOPE_DECODER = msgspec.json.Decoder(_Envelope)
+    _KLINES_DECODER = msgspec.json.Decoder(List[_KlineMsg], strict=False)
+    _TRADES_DECODER = msgspec.json.Decoder(List[_TradeMsg], strict=False)
+
+
+class _BybitListener(WSListener):
+    """Слушатель picows: кадры разбираются в том же event loop, без передачи между потоками"""
+    
+    def __init__(self, client: "PybitWebSocket"):
+        super().__init__()
+        self.client = client
+    
+    def on_ws_connected(self, transport: WSTransport):
+        self.client.logger.info("WebSocket транспорт установлен")
+    
+    def on_ws_frame(self, transport: WSTransport, frame: WSFrame):
+        if frame.msg_type == WSMsgType.TEXT:
+            # Один разбор JSON прямо из буфера кадра
+            self.client._on_frame(frame.get_payload_as_memoryview(), datetime.now())
+        elif frame.msg_type == WSMsgType.PING:
+            transport.send_pong(frame.get_payload_as_bytes())
+        elif frame.msg_type == WSMsgType.CLOSE:
+            transport.send_close(frame.get_close_code(), frame.get_close_message())
+            transport.disconnect()
+    
+    def on_ws_disconnected(self, transport: WSTransport):
+        self.client.is_connected = False
+        self.client.logger.warning("WebSocket соединение закрыто")
+
 
 class PybitWebSocket:
     """Чистый WebSocket клиент - только получение данных"""
     
+    __slots__ = (
+        "settings", "symbol", "http_client",
+        "ws", "is_connected", "_should_run", "_connection_task",
+        "_ticker_state", "_orderbook_bids", "_orderbook_asks", "_top_bids", "_top_asks",
+        "_bids_dirty", "_asks_dirty", "_pending_orderbook",
+        "on_kline", "on_ticker", "on_orderbook", "on_trades",
+        "_dispatch", "_rest_cache", "logger"
+    )
+    
     def __init__(self, symbol: str):
         self.settings = get_settings()
         self.symbol = symbol
         
-        # HTTP клиент для REST запросов
-        self.http_client = PybitHTTP(testnet=self.settings.BYBIT_WS_TESTNET)
+        # HTTP клиент pybit для REST запросов
+        self.http_client = _get_http(self.settings.BYBIT_WS_TESTNET)
+        # Кэш REST ответов: ключ -> (monotonic время, результат)
+        self._rest_cache: Dict[Tuple, Tuple[float, Any]] = {}
         
-        # WebSocket клиент pybit
+        # WebSocket транспорт picows
         self.ws = None
         self.is_connected = False
+        self._should_run = False
+        self._connection_task = None
+        
+        # Локальное состояние для применения delta-сообщений Bybit
+        self._ticker_state = {}
+        self._orderbook_bids = {}  # price -> size
+        self._orderbook_asks = {}
+        # Кэш топ-10 для выдачи потребителям: (price, size) кортежи прямо из heapq, без перепаковки
+        self._top_bids: List[Tuple[float, float]] = []
+        self._top_asks: List[Tuple[float, float]] = []
+        # Топ-10 пересчитывается и публикуется один раз за итерацию loop, а не на каждую delta
+        self._bids_dirty = False
+        self._asks_dirty = False
+        self._pending_orderbook: Optional[Tuple[Dict, datetime]] = None
         
         # Callback функции для передачи данных
         self.on_kline = None
@@ -31,6 +133,14 @@ class PybitWebSocket:
         self.on_orderbook = None
         self.on_trades = None
         
+        # Маршрутизация по префиксу топика (до первой точки)
+        self._dispatch = {
+            "kline": self._handle_kline_raw,
+            "tickers": self._handle_ticker_raw,
+            "orderbook": self._handle_orderbook_raw,
+            "publicTrade": self._handle_trades_raw
+        }
+        
         self.logger = logging.getLogger(__name__)
         self.logger.info(f"PybitWebSocket инициализирован для {symbol}")
     
@@ -48,195 +158,420 @@ class PybitWebSocket:
     async def connect(self):
         """Подключение к WebSocket"""
         try:
-            self.logger.info("Подключение к pybit WebSocket...")
+            self.logger.info(f"Подключение к Bybit WebSocket (picows): {self.settings.websocket_url}")
             
-            # Создаем WebSocket для публичных данных
-            self.ws = PybitWebSocket(
-                testnet=self.settings.BYBIT_WS_TESTNET,
-                channel_type="linear"
-            )
+            self._should_run = True
+            self._pin_event_loop_thread()
+            await self._open_connection()
             
-            # Подписываемся на потоки данных
-            self._subscribe_to_streams()
+            # Фоновая задача: ping и переподключение
+            self._connection_task = asyncio.create_task(self._connection_loop())
             
-            self.is_connected = True
             self.logger.info("WebSocket успешно подключен")
             
         except Exception as e:
             self.logger.error(f"Ошибка подключения WebSocket: {e}")
             raise
     
+    def _pin_event_loop_thread(self):
+        """Привязка общего event loop приложения к ядру CPU (BYBIT_WS_CORE, только Linux)"""
+        core = self.settings.WS_CPU_CORE
+        if core < 0 or not hasattr(os, "sched_setaffinity"):
+            return
+        
+        try:
+            original_mask = os.sched_getaffinity(0)
+            if original_mask == {core}:
+                return  # уже привязан (повторный connect или запуск через taskset)
+            
+            # Потоки, созданные циклом после привязки, наследуют его маску, поэтому default executor
+            # (run_in_executor(None), asyncio.to_thread) заменяется пулом, потоки которого
+            # при старте возвращают себе исходную маску процесса
+            loop = asyncio.get_running_loop()
+            previous_executor = getattr(loop, "_default_executor", None)
+            loop.set_default_executor(
+                ThreadPoolExecutor(initializer=os.sched_setaffinity, initargs=(0, original_mask))
+            )
+            # set_default_executor не останавливает прежний пул (asyncio раскрывает его, uvloop - нет)
+            if previous_executor is not None:
+                previous_executor.shutdown(wait=False)
+            
+            os.sched_setaffinity(threading.get_native_id(), {core})
+            self.logger.info(f"Event loop WebSocket привязан к ядру {core}, executor - ядра {sorted(original_mask)}")
+        except OSError as e:
+            self.logger.warning(f"Не удалось привязать event loop к ядру {core}: {e}")
+    
+    async def _open_connection(self):
+        """Открытие соединения и подписка на потоки"""
+        self.ws, _ = await ws_connect(lambda: _BybitListener(self), self.settings.websocket_url)
+        self._subscribe_to_streams()
+        self.is_connected = True
+    
+    async def _connection_loop(self):
+        """Удержание соединения: ping от клиента и переподключение"""
+        while self._should_run:
+            ping_task = asyncio.create_task(self._ping_loop())
+            try:
+                await self.ws.wait_disconnected()
+            finally:
+                ping_task.cancel()
+            
+            self.is_connected = False
+            
+            for attempt in range(1, self.settings.WS_RECONNECT_ATTEMPTS + 1):
+                if not self._should_run:
+                    return
+                
+                delay = self.settings.WS_RECONNECT_DELAY * attempt
+                self.logger.info(f"Переподключение через {delay} сек (попытка {attempt})")
+                await asyncio.sleep(delay)
+                
+                try:
+                    await self._open_connection()
+                    break
+                except Exception as e:
+                    self.logger.error(f"Ошибка переподключения: {e}")
+            else:
+                self.logger.error("Превышен лимит попыток переподключения")
+                return
+    
+    async def _ping_loop(self):
+        """Ping от клиента, как рекомендует Bybit"""
+        while self.is_connected:
+            await asyncio.sleep(self.settings.WS_PING_INTERVAL)
+            self.ws.send(WSMsgType.TEXT, b'{"op":"ping"}')
+    
     def _subscribe_to_streams(self):
         """Подписка на потоки данных"""
+        topics = [
+            f"kline.5.{self.symbol}",  # 5 минут
+            f"tickers.{self.symbol}",
+            f"orderbook.50.{self.symbol}",
+            f"publicTrade.{self.symbol}"
+        ]
         
-        # Подписка на kline (свечи)
-        self.ws.kline_stream(
-            interval=5,  # 5 минут
-            symbol=self.symbol,
-            callback=self._handle_kline_raw
-        )
-        
-        # Подписка на ticker
-        self.ws.ticker_stream(
-            symbol=self.symbol,
-            callback=self._handle_ticker_raw
-        )
-        
-        # Подписка на orderbook
-        self.ws.orderbook_stream(
-            depth=50,
-            symbol=self.symbol,
-            callback=self._handle_orderbook_raw
-        )
-        
-        # Подписка на торги
-        self.ws.trade_stream(
-            symbol=self.symbol,
-            callback=self._handle_trades_raw
-        )
+        # Новое соединение начинается со snapshot - сбрасываем локальное состояние
+        self._ticker_state = {}
+        self._orderbook_bids = {}
+        self._orderbook_asks = {}
+        self._top_bids = []
+        self._top_asks = []
+        self._bids_dirty = False
+        self._asks_dirty = False
+        self._pending_orderbook = None
         
+        self.ws.send(WSMsgType.TEXT, orjson.dumps({"op": "subscribe", "args": topics}))
         self.logger.info(f"Подписки активированы для {self.symbol}")
     
-    def _handle_kline_raw(self, message):
-        """Обработка сырых kline данных"""
+    def _on_frame(self, payload, now: datetime):
+        """Разбор кадра: kline/publicTrade через msgspec (при наличии), ticker/orderbook - через orjson"""
+        if not MSGSPEC_AVAILABLE:
+            try:
+                message = orjson.loads(payload)
+            except orjson.JSONDecodeError as e:
+                self.logger.error(f"Ошибка разбора кадра: {e}")
+                return
+            self._on_message(message, now)
+            return
+        
+        # Битый или неожиданный кадр не должен выходить в on_ws_frame и останавливать слушатель
         try:
-            # Извлекаем данные из pybit сообщения
-            kline_data = self._extract_kline_data(message)
-            if kline_data and self.on_kline:
-                # Передаем ТОЛЬКО обработанные данные
-                self.on_kline(kline_data)
-                
-        except Exception as e:
-            self.logger.error(f"Ошибка обработки kline: {e}")
+            envelope = _ENVELOPE_DECODER.decode(payload)
+        except msgspec.DecodeError as e:
+            self.logger.error(f"Ошибка разбора кадра: {e}")
+            return
+        
+        topic = envelope.topic
+        if not topic:
+            # Служебные ответы редки - полный разбор
+            try:
+                message = orjson.loads(payload)
+            except orjson.JSONDecodeError as e:
+                self.logger.error(f"Ошибка разбора служебного кадра: {e}")
+                return
+            self._on_message(message, now)
+            return
+        
+        # kline/publicTrade декодируются сразу в типизированные структуры: float/int из строк Bybit
+        # за один проход парсера, без промежуточного dict и повторного float().
+        # Ticker/orderbook сливаются в локальное состояние как dict
+        prefix = topic.partition(".")[0]
+        if prefix == "kline" or prefix == "publicTrade":
+            try:
+                if prefix == "kline":
+                    self._handle_kline_typed(_KLINES_DECODER.decode(envelope.data), now)
+                else:
+                    self._handle_trades_typed(_TRADES_DECODER.decode(envelope.data), now)
+            except Exception as e:
+                self.logger.error(f"Ошибка обработки {topic}: {e}")
+            return
+        
+        try:
+            data = orjson.loads(memoryview(envelope.data))
+        except orjson.JSONDecodeError as e:
+            self.logger.error(f"Ошибка разбора {topic}: {e}")
+            return
+        self._on_message({"topic": topic, "type": envelope.type, "data": data}, now)
     
-    def _handle_ticker_raw(self, message):
-        """Обработка сырых ticker данных"""
+    def _on_message(self, message: Dict, now: datetime):
+        """Маршрутизация сообщения по топику (now - одно время получения на весь фрейм)"""
+        # Единственная точка перехвата ошибок горячего пути: обработчики ниже своих try не держат
+        topic = None
         try:
-            ticker_data = self._extract_ticker_data(message)
-            if ticker_data and self.on_ticker:
-                self.on_ticker(ticker_data)
-                
+            topic = message.get("topic")
+            
+            if not topic:
+                # Служебные ответы: подписка, pong
+                if message.get("op") == "subscribe" and not message.get("success", False):
+                    self.logger.error(f"Ошибка подписки: {message.get('ret_msg')}")
+                return
+            
+            handler = self._dispatch.get(topic.partition(".")[0])
+            if handler:
+                handler(message, now)
         except Exception as e:
-            self.logger.error(f"Ошибка обработки ticker: {e}")
+            self.logger.error(f"Ошибка обработки {topic}: {e}")
+    
+    def _apply_ticker_update(self, message: Dict) -> Optional[Dict]:
+        """Применение snapshot/delta ticker к локальному состоянию; None если данных нет"""
+        data = message.get("data")
+        if not data:
+            return None
+        
+        if message.get("type") == "snapshot":
+            self._ticker_state = dict(data)
+        else:
+            self._ticker_state.update(data)
+        
+        return self._ticker_state
     
-    def _handle_orderbook_raw(self, message):
-        """Обработка сырых orderbook данных"""
+    def _apply_orderbook_update(self, message: Dict) -> Optional[Dict]:
+        """Применение snapshot/delta orderbook к локальной книге; возвращает data сообщения или None"""
+        data = message.get("data")
+        if not data:
+            return None
+        
+        snapshot = message.get("type") == "snapshot"
+        
+        if snapshot:
+            self._orderbook_bids = {}
+            self._orderbook_asks = {}
+        
+        # Каждая delta сливается сразу (пропускать их нельзя), а сторона помечается для пересчета топ-10,
+        # только если delta задела уровни в пределах топа (None - топ неполный, любое изменение его задевает)
+        bid_floor = self._top_bids[-1][0] if len(self._top_bids) == 10 else None
+        ask_ceiling = self._top_asks[-1][0] if len(self._top_asks) == 10 else None
+        
+        # Bybit v5 всегда присылает обе стороны "b"/"a" (в delta - возможно пустые)
+        bids_changed = self._merge_levels(self._orderbook_bids, data["b"], bid_floor, True)
+        asks_changed = self._merge_levels(self._orderbook_asks, data["a"], ask_ceiling, False)
+        
+        # Пока сторона помечена, закэшированный топ устарел, но граница нужна только для пометки
+        self._bids_dirty = self._bids_dirty or snapshot or bids_changed
+        self._asks_dirty = self._asks_dirty or snapshot or asks_changed
+        
+        return data
+    
+    def _refresh_top_levels(self):
+        """Пересчет топ-10 помеченных сторон (потребителям нужны только 10 лучших уровней)"""
+        if self._bids_dirty:
+            self._top_bids = heapq.nlargest(10, self._orderbook_bids.items())
+            self._bids_dirty = False
+        if self._asks_dirty:
+            self._top_asks = heapq.nsmallest(10, self._orderbook_asks.items())
+            self._asks_dirty = False
+    
+    @staticmethod
+    def _merge_levels(book: Dict[float, float], levels: List, boundary: Optional[float], is_bid: bool) -> bool:
+        """Слияние уровней одной стороны; True если изменение попало в пределы топ-10"""
+        changed = False
+        for price, size in levels:
+            # Строки Bybit приводятся к float один раз - при слиянии
+            price = float(price)
+            size = float(size)
+            if size == 0:
+                book.pop(price, None)
+            else:
+                book[price] = size
+            
+            if boundary is None or (price >= boundary if is_bid else price <= boundary):
+                changed = True
+        
+        return changed
+    
+    def _handle_kline_raw(self, message, now: datetime):
+        """Обработка сырых kline данных"""
+        # Извлекаем данные из pybit сообщения
+        kline_data = self._extract_kline_data(message, now)
+        if kline_data and self.on_kline:
+            # Передаем ТОЛЬКО обработанные данные
+            self.on_kline(kline_data)
+    
+    def _handle_kline_typed(self, klines: List, now: datetime):
+        """Свеча из типизированной структуры msgspec: поля уже int/float"""
+        if not klines or not self.on_kline:
+            return
+        
+        kline = klines[0]
+        self.on_kline({
+            "symbol": self.symbol,
+            "timestamp": kline.start,
+            "open": kline.open,
+            "high": kline.high,
+            "low": kline.low,
+            "close": kline.close,
+            "volume": kline.volume,
+            "confirm": kline.confirm,
+            "interval": kline.interval,
+            "raw_timestamp": now
+        })
+    
+    def _handle_trades_typed(self, trades: List, now: datetime):
+        """Сделки из типизированных структур msgspec: поля уже int/float"""
+        if not trades or not self.on_trades:
+            return
+        
+        symbol = self.symbol
+        self.on_trades([
+            {
+                "symbol": symbol,
+                "timestamp": trade.T,
+                "price": trade.p,
+                "size": trade.v,
+                "side": trade.S,
+                "trade_id": trade.i,
+                "raw_timestamp": now
+            }
+            for trade in trades
+        ])
+    
+    def _handle_ticker_raw(self, message, now: datetime):
+        """Обработка сырых ticker данных (snapshot/delta сливаются в локальное состояние)"""
+        ticker = self._apply_ticker_update(message)
+        if ticker is None:
+            return
+        
+        ticker_data = self._extract_ticker_data(ticker, now)
+        if ticker_data and self.on_ticker:
+            self.on_ticker(ticker_data)
+    
+    def _handle_orderbook_raw(self, message, now: datetime):
+        """Обработка сырых orderbook данных (snapshot/delta сливаются в локальную книгу)"""
+        data = self._apply_orderbook_update(message)
+        if data is None:
+            return
+        
+        # Публикация откладывается до следующей итерации loop: пачка delta из одного чтения сокета
+        # дает один пересчет топ-10 и один callback с последним состоянием
+        if self._pending_orderbook is None:
+            asyncio.get_running_loop().call_soon(self._flush_orderbook)
+        self._pending_orderbook = (data, now)
+    
+    def _flush_orderbook(self):
+        """Публикация последнего состояния книги за итерацию loop"""
+        pending = self._pending_orderbook
+        if pending is None:
+            return
+        self._pending_orderbook = None
+        
         try:
-            orderbook_data = self._extract_orderbook_data(message)
+            self._refresh_top_levels()
+            orderbook_data = self._extract_orderbook_data(*pending)
             if orderbook_data and self.on_orderbook:
                 self.on_orderbook(orderbook_data)
-                
         except Exception as e:
-            self.logger.error(f"Ошибка обработки orderbook: {e}")
+            self.logger.error(f"Ошибка публикации orderbook: {e}")
     
-    def _handle_trades_raw(self, message):
+    def _handle_trades_raw(self, message, now: datetime):
         """Обработка сырых trade данных"""
-        try:
-            trades_data = self._extract_trades_data(message)
-            if trades_data and self.on_trades:
-                self.on_trades(trades_data)
-                
-        except Exception as e:
-            self.logger.error(f"Ошибка обработки trades: {e}")
+        trades_data = self._extract_trades_data(message, now)
+        if trades_data and self.on_trades:
+            self.on_trades(trades_data)
     
-    def _extract_kline_data(self, message) -> Optional[Dict]:
-        """Извлечение kline данных из pybit сообщения"""
+    def _extract_kline_data(self, message, now: datetime) -> Optional[Dict]:
+        """Извлечение kline данных из сообщения Bybit"""
         try:
-            # Безопасное извлечение данных
-            if isinstance(message, dict) and 'data' in message:
-                data_list = message['data']
-                if isinstance(data_list, list) and len(data_list) > 0:
-                    kline = data_list[0]
-                    
-                    return {
-                        "symbol": self.symbol,
-                        "timestamp": int(kline.get('start', 0)),
-                        "open": float(kline.get('open', 0)),
-                        "high": float(kline.get('high', 0)),
-                        "low": float(kline.get('low', 0)),
-                        "close": float(kline.get('close', 0)),
-                        "volume": float(kline.get('volume', 0)),
-                        "confirm": kline.get('confirm', False),
-                        "interval": kline.get('interval', '5'),
-                        "raw_timestamp": datetime.now()
-                    }
+            # Поля свечи обязательны в протоколе - читаются напрямую, без .get и проверок типа;
+            # start приходит JSON-числом (ms), orjson уже отдает int - повторный int() не нужен
+            kline = message['data'][0]
+            
+            return {
+                "symbol": self.symbol,
+                "timestamp": kline['start'],
+                "open": float(kline['open']),
+                "high": float(kline['high']),
+                "low": float(kline['low']),
+                "close": float(kline['close']),
+                "volume": float(kline['volume']),
+                "confirm": kline['confirm'],
+                "interval": kline['interval'],
+                "raw_timestamp": now
+            }
         except Exception as e:
-            self.logger.debug(f"Не удалось извлечь kline данные: {e}")
+            self.logger.error(f"Не удалось извлечь kline данные: {e}")
         
         return None
     
-    def _extract_ticker_data(self, message) -> Optional[Dict]:
-        """Извлечение ticker данных из pybit сообщения"""
+    def _extract_ticker_data(self, ticker: Dict, now: datetime) -> Optional[Dict]:
+        """Извлечение ticker данных из слитого состояния _apply_ticker_update"""
         try:
-            # Поддержка разных форматов pybit
-            if isinstance(message, dict):
-                if 'data' in message:
-                    ticker = message['data']
-                    if isinstance(ticker, list) and len(ticker) > 0:
-                        ticker = ticker[0]
-                else:
-                    ticker = message
-                
-                return {
-                    "symbol": ticker.get('symbol', self.symbol),
-                    "last_price": float(ticker.get('lastPrice', 0)),
-                    "price_24h_pcnt": float(ticker.get('price24hPcnt', 0)),
-                    "volume_24h": float(ticker.get('volume24h', 0)),
-                    "high_24h": float(ticker.get('highPrice24h', 0)),
-                    "low_24h": float(ticker.get('lowPrice24h', 0)),
-                    "bid1_price": float(ticker.get('bid1Price', 0)),
-                    "ask1_price": float(ticker.get('ask1Price', 0)),
-                    "raw_timestamp": datetime.now()
-                }
+            # .get оставлен: до первого snapshot отдельные поля могут отсутствовать;
+            # метод связывается локально один раз - без повторного поиска атрибута на каждое поле
+            get = ticker.get
+            return {
+                "symbol": get('symbol', self.symbol),
+                "last_price": float(get('lastPrice', 0)),
+                "price_24h_pcnt": float(get('price24hPcnt', 0)),
+                "volume_24h": float(get('volume24h', 0)),
+                "high_24h": float(get('highPrice24h', 0)),
+                "low_24h": float(get('lowPrice24h', 0)),
+                "bid1_price": float(get('bid1Price', 0)),
+                "ask1_price": float(get('ask1Price', 0)),
+                "raw_timestamp": now
+            }
         except Exception as e:
-            self.logger.debug(f"Не удалось извлечь ticker данные: {e}")
+            self.logger.error(f"Не удалось извлечь ticker данные: {e}")
         
         return None
     
-    def _extract_orderbook_data(self, message) -> Optional[Dict]:
-        """Извлечение orderbook данных из pybit сообщения"""
+    def _extract_orderbook_data(self, data: Dict, now: datetime) -> Optional[Dict]:
+        """Извлечение orderbook данных из слитой локальной книги"""
         try:
-            if isinstance(message, dict) and 'data' in message:
-                data = message['data']
-                
-                bids = data.get('b', [])
-                asks = data.get('a', [])
-                
-                return {
-                    "symbol": self.symbol,
-                    "bids": [[float(bid[0]), float(bid[1])] for bid in bids[:10]],
-                    "asks": [[float(ask[0]), float(ask[1])] for ask in asks[:10]],
-                    "timestamp": data.get('u', int(datetime.now().timestamp() * 1000)),
-                    "raw_timestamp": datetime.now()
-                }
+            # Уровни уже float и обрезаны до 10 в _refresh_top_levels, из data берется только u
+            return {
+                "symbol": self.symbol,
+                "bids": self._top_bids,
+                "asks": self._top_asks,
+                "timestamp": data.get('u') or int(now.timestamp() * 1000),
+                "raw_timestamp": now
+            }
         except Exception as e:
-            self.logger.debug(f"Не удалось извлечь orderbook данные: {e}")
+            self.logger.error(f"Не удалось извлечь orderbook данные: {e}")
         
         return None
     
-    def _extract_trades_data(self, message) -> Optional[List[Dict]]:
-        """Извлечение trade данных из pybit сообщения"""
+    def _extract_trades_data(self, message, now: datetime) -> Optional[List[Dict]]:
+        """Извлечение trade данных из сообщения Bybit"""
         try:
-            if isinstance(message, dict) and 'data' in message:
-                trades_list = message['data']
-                if not isinstance(trades_list, list):
-                    trades_list = [trades_list]
-                
-                processed_trades = []
-                for trade in trades_list:
-                    processed_trades.append({
-                        "symbol": self.symbol,
-                        "timestamp": int(trade.get('T', 0)),
-                        "price": float(trade.get('p', 0)),
-                        "size": float(trade.get('v', 0)),
-                        "side": trade.get('S', ''),
-                        "trade_id": trade.get('i', ''),
-                        "raw_timestamp": datetime.now()
-                    })
-                
-                return processed_trades if processed_trades else None
+            # Поля сделки обязательны в протоколе - читаются напрямую, без .get и проверок типа;
+            # T приходит JSON-числом (ms), orjson уже отдает int - повторный int() не нужен
+            symbol = self.symbol
+            processed_trades = [
+                {
+                    "symbol": symbol,
+                    "timestamp": trade['T'],
+                    "price": float(trade['p']),
+                    "size": float(trade['v']),
+                    "side": trade['S'],
+                    "trade_id": trade['i'],
+                    "raw_timestamp": now
+                }
+                for trade in message['data']
+            ]
+            
+            return processed_trades if processed_trades else None
         except Exception as e:
-            self.logger.debug(f"Не удалось извлечь trades данные: {e}")
+            self.logger.error(f"Не удалось извлечь trades данные: {e}")
         
         return None
     
@@ -273,11 +608,48 @@ class PybitWebSocket:
         
         return None
     
+    async def get_rest_ticker_async(self, symbol: str = None) -> Optional[Dict]:
+        """Получение ticker через REST API без блокировки event loop (кэш 1 секунда)"""
+        return await self._cached_rest(("tickers", symbol or self.symbol), 1.0, self.get_rest_ticker, symbol)
+    
+    async def get_rest_klines_async(self, symbol: str = None, limit: int = 50) -> Optional[List]:
+        """Получение klines через REST API без блокировки event loop (кэш 5 секунд)"""
+        return await self._cached_rest(("kline", symbol or self.symbol, limit), 5.0, self.get_rest_klines, symbol, limit)
+    
+    async def _cached_rest(self, key: Tuple, ttl: float, fetch: Callable, *args) -> Any:
+        """Блокирующий REST вызов в потоке; успешный ответ переиспользуется ttl секунд"""
+        now = time.monotonic()
+        cached = self._rest_cache.get(key)
+        if cached and now - cached[0] < ttl:
+            return cached[1]
+        
+        result = await asyncio.to_thread(fetch, *args)
+        if result:
+            self._rest_cache[key] = (now, result)
+        return result
+    
     async def disconnect(self):
         """Отключение от WebSocket"""
         try:
+            self._should_run = False
             self.is_connected = False
-            # pybit автоматически управляет соединениями
+            
+            if self._connection_task and not self._connection_task.done():
+                self._connection_task.cancel()
+                try:
+                    await self._connection_task
+                except asyncio.CancelledError:
+                    pass
+            
+            if self.ws:
+                # Штатное закрытие: ждем ответный CLOSE не дольше 2 секунд, затем рвем соединение
+                self.ws.send_close(WSCloseCode.OK)
+                try:
+                    await asyncio.wait_for(self.ws.wait_disconnected(), timeout=2.0)
+                except asyncio.TimeoutError:
+                    self.logger.warning("WebSocket не закрылся за 2 секунды, принудительное отключение")
+                    self.ws.disconnect()
+            
             self.logger.info("WebSocket отключен")
         except Exception as e:
             self.logger.error(f"Ошибка отключения WebSocket: {e}")
@@ -289,6 +661,7 @@ class PybitWebSocket:
             "websocket_active": self.ws is not None,
             "symbol": self.symbol,
             "testnet": self.settings.BYBIT_WS_TESTNET,
+            "transport": "picows",
             "callbacks_set": {
                 "kline": self.on_kline is not None,
                 "ticker": self.on_ticker is not None,
@@ -4,16 +4,46 @@
 """
 
 import logging
+import time
+from collections import deque
 from datetime import datetime, timedelta
-from typing import Dict, List, Optional, Callable, Any
+from itertools import islice
+from typing import Dict, List, Optional, Callable, Any, Tuple
 from dataclasses import dataclass
 
 from config.settings import get_settings
+from core.data_processor import RollingWindow
 
 
-@dataclass
+# Шаблоны причин сигналов: правила сохраняют (код, аргументы), текст собирается только для отправляемого сигнала
+REASON_TEMPLATES = {
+    "NO_PRICE": "Нет данных о текущей цене",
+    "RSI_OVERSOLD": "RSI пересыщен: %.1f",
+    "RSI_OVERBOUGHT": "RSI перекуплен: %.1f",
+    "MA_ABOVE": "Цена выше коротких MA (короткая: %.2f, длинная: %.2f)",
+    "MA_BELOW": "Цена ниже коротких MA (короткая: %.2f, длинная: %.2f)",
+    "MACD_BULLISH": "MACD бычий (MACD: %.4f > Signal: %.4f)",
+    "MACD_BEARISH": "MACD медвежий (MACD: %.4f < Signal: %.4f)",
+    "BB_LOWER": "Цена касается нижней полосы Боллинджера (%.2f <= %.2f)",
+    "BB_UPPER": "Цена касается верхней полосы Боллинджера (%.2f >= %.2f)",
+    "ORDERBOOK_BUY": "Сильный дисбаланс в пользу покупок (%.2f%%)",
+    "ORDERBOOK_SELL": "Сильный дисбаланс в пользу продаж (%.2f%%)",
+    "MOMENTUM_UP": "Сильный восходящий momentum (цена выше EMA на %.2f%%)",
+    "MOMENTUM_DOWN": "Сильный нисходящий momentum (цена ниже EMA на %.2f%%)",
+    "NO_SIGNALS": "Нет четких торговых сигналов",
+    "CONFLICTING": "Противоречивые сигналы (покупка/продажа сбалансированы)",
+    "ERROR": "Ошибка анализа: %s"
+}
+
+# Сообщения валидации: проверка идет на каждом тике, cooldown-сообщение - на большинстве из них
+_MSG_FEW_KLINES = "Недостаточно kline данных: %d/30"
+_MSG_STALE_DATA = "Устаревшие данные: %s"
+_MSG_COOLDOWN = "Активен cooldown сигналов (%d мин)"
+
+
+@dataclass(slots=True)
 class TradingSignal:
-    """Торговый сигнал"""
+    """Торговый сигнал (slots: без __dict__ на каждый экземпляр истории)"""
     signal_id: str
     symbol: str
     signal_type: str  # BUY, SELL, HOLD
@@ -32,13 +62,38 @@ class SignalProcessor:
     def __init__(self):
         self.settings = get_settings()
         
-        # История сигналов
-        self.signals_history = []
-        self.last_signal_time = None
+        # Пороги и параметры из настроек читаются один раз (настройки не меняются во время работы)
+        settings = self.settings
+        self._rsi_oversold = settings.RSI_OVERSOLD
+        self._rsi_overbought = settings.RSI_OVERBOUGHT
+        self._min_confidence = settings.MIN_SIGNAL_CONFIDENCE
+        self._trading_pair = settings.TRADING_PAIR
+        self._timeframe = settings.STRATEGY_TIMEFRAME
+        self._cooldown_seconds = settings.SIGNAL_COOLDOWN_MINUTES * 60.0
+        
+        # История сигналов (кольцевой буфер: старые вытесняются без копирования списка)
+        self.max_signals_history = 100
+        self.signals_history = deque(maxlen=self.max_signals_history)
+        self.last_signal_time = None  # для отображения
+        self._last_signal_monotonic: Optional[float] = None  # для cooldown: не зависит от перевода часов
+        self._signal_seq = 0  # порядковый номер сигнала для signal_id
+        
+        # Счетчики статистики, поддерживаемые при добавлении/вытеснении сигналов
+        self._signal_counts = {"BUY": 0, "SELL": 0}
+        self._confidence_sum = 0.0
+        self._confidence_adds = 0  # добавления с последнего точного пересчета _confidence_sum
+        self._today_date = None
+        self._today_count = 0
         
         # Callback для отправки сигналов
         self.on_signal_generated = None
         
+        # Последняя проанализированная свеча: (timestamp, close)
+        self._last_analyzed_bar: Optional[Tuple[int, float]] = None
+        # Объемы последних 10 сделок и id последней учтенной сделки
+        self._volume_window = RollingWindow(10)
+        self._volume_last_trade_id = None
+        
         self.logger = logging.getLogger(__name__)
         self.logger.info("SignalProcessor инициализирован")
     
@@ -46,101 +101,126 @@ class SignalProcessor:
         """Установка callback для отправки сигналов"""
         self.on_signal_generated = callback
     
-    def analyze_market_data(self, market_data: Dict) -> Optional[TradingSignal]:
+    def analyze_market_data(self, market_data: Dict, indicators: Optional[Dict] = None) -> Optional[TradingSignal]:
         """
         Анализ рыночных данных и генерация сигналов
         СИНХРОННАЯ функция - НЕ async!
         """
-        try:
-            # Проверяем cooldown между сигналами
-            if self._is_signal_cooldown():
-                return None
-            
-            # Извлекаем данные для анализа
-            klines = market_data.get("recent_klines", [])
-            ticker = market_data.get("basic_market", {})
-            orderbook = market_data.get("orderbook", {})
-            trades = market_data.get("recent_trades", [])
-            
-            if not klines or len(klines) < 30:
-                self.logger.debug("Недостаточно kline данных для анализа")
-                return None
-            
-            # Вычисляем технические индикаторы
-            from core.data_processor import DataProcessor
-            processor = DataProcessor()
-            indicators = processor.calculate_technical_indicators(klines)
-            
-            if not indicators:
-                self.logger.debug("Не удалось вычислить индикаторы")
-                return None
-            
-            # Анализируем условия для генерации сигнала
-            signal_type, confidence, reason = self._analyze_trading_conditions(
-                indicators, ticker, orderbook, trades
-            )
-            
-            # Проверяем минимальную уверенность
-            if signal_type == "HOLD" or confidence < self.settings.MIN_SIGNAL_CONFIDENCE:
-                return None
-            
-            # Создаем сигнал
-            signal = TradingSignal(
-                signal_id=f"{self.settings.TRADING_PAIR}_{datetime.now().strftime('%Y%m%d_%H%M%S')}",
-                symbol=self.settings.TRADING_PAIR,
-                signal_type=signal_type,
-                price=indicators.get("current_price", 0),
-                confidence=confidence,
-                timestamp=datetime.now(),
-                reason=reason,
-                indicators=indicators,
-                timeframe=self.settings.STRATEGY_TIMEFRAME,
-                metadata={
-                    "data_quality": market_data.get("metadata", {}).get("data_quality", {}),
-                    "analysis_timestamp": datetime.now().isoformat()
-                }
-            )
-            
-            # Сохраняем в истории
-            self.signals_history.append(signal)
-            self.last_signal_time = datetime.now()
-            
-            # Ограничиваем размер истории
-            if len(self.signals_history) > 100:
-                self.signals_history = self.signals_history[-100:]
-            
-            # Отправляем callback если настроен
-            if self.on_signal_generated:
-                try:
-                    self.on_signal_generated(signal)
-                except Exception as e:
-                    self.logger.error(f"Ошибка callback сигнала: {e}")
-            
-            self.logger.info(f"Сгенерирован сигнал: {signal_type} {signal.symbol} @ {signal.price:.4f} (уверенность: {confidence:.2%})")
-            self.logger.info(f"Причина: {reason}")
-            
-            return signal
-            
-        except Exception as e:
-            self.logger.error(f"Ошибка анализа рыночных данных: {e}")
+        # Исключения анализа обрабатывает вызывающий код; здесь ловятся только ошибки внешнего callback
+        # Проверяем cooldown между сигналами
+        if self._is_signal_cooldown():
             return None
+        
+        # Одно время на весь анализ: id, timestamp и metadata сигнала согласованы
+        now = datetime.now()
+        
+        # Извлекаем данные для анализа
+        klines = market_data.get("recent_klines")
+        ticker = market_data.get("basic_market") or {}
+        orderbook = market_data.get("orderbook") or {}
+        trades = market_data.get("recent_trades") or []
+        
+        if klines is None or len(klines) < 30:
+            self.logger.debug("Недостаточно kline данных для анализа")
+            return None
+        
+        # Повторный опрос той же свечи без движения цены пропускается до расчетов
+        last_kline = klines[-1]
+        bar = (last_kline["timestamp"], last_kline["close"])
+        if bar == self._last_analyzed_bar:
+            self.logger.debug("Свеча уже проанализирована, цена не изменилась")
+            return None
+        
+        # Технические индикаторы уже посчитаны владельцем данных (MarketManager) по подтвержденным свечам;
+        # без снимка берется market_data["technical_indicators"] - собственного состояния индикаторов здесь нет
+        if indicators is None:
+            indicators = market_data.get("technical_indicators")
+        
+        if not indicators:
+            self.logger.debug("Не удалось вычислить индикаторы")
+            return None
+        
+        # Анализируем условия для генерации сигнала
+        signal_type, confidence, reason_parts = self._analyze_trading_conditions(
+            indicators, ticker, orderbook, trades
+        )
+        self._last_analyzed_bar = bar
+        
+        # Проверяем минимальную уверенность
+        if signal_type == "HOLD" or confidence < self._min_confidence:
+            return None
+        
+        # Текст причины собирается только для сигнала, который будет отправлен
+        reason = self._format_reason(reason_parts)
+        
+        # Качество данных из metadata (без промежуточных пустых dict при отсутствии)
+        meta = market_data.get("metadata")
+        data_quality = meta.get("data_quality") if meta else None
+        
+        # Создаем сигнал (id из целых чисел: без strftime и локали)
+        self._signal_seq += 1
+        signal = TradingSignal(
+            signal_id=f"{self._trading_pair}_{int(now.timestamp())}_{self._signal_seq}",
+            symbol=self._trading_pair,
+            signal_type=signal_type,
+            price=indicators.get("current_price", 0),
+            confidence=confidence,
+            timestamp=now,
+            reason=reason,
+            indicators=indicators,
+            timeframe=self._timeframe,
+            metadata={
+                "data_quality": data_quality or {},
+                "analysis_timestamp": now.isoformat()
+            }
+        )
+        
+        # Сохраняем в истории (вытесняемый сигнал вычитается из счетчиков)
+        history = self.signals_history
+        if len(history) == history.maxlen:
+            self._count_signal(history[0], -1)
+        history.append(signal)
+        self._count_signal(signal, 1)
+        self.last_signal_time = now
+        self._last_signal_monotonic = time.monotonic()
+        
+        # Отправляем callback если настроен
+        if self.on_signal_generated:
+            try:
+                self.on_signal_generated(signal)
+            except Exception as e:
+                self.logger.error(f"Ошибка callback сигнала: {e}")
+        
+        self.logger.info(
+            "Сгенерирован сигнал: %s %s @ %.4f (уверенность: %.2f%%)",
+            signal_type, signal.symbol, signal.price, confidence * 100
+        )
+        self.logger.info("Причина: %s", reason)
+        
+        return signal
     
     def _analyze_trading_conditions(self, indicators: Dict, ticker: Dict, orderbook: Dict, trades: List) -> tuple:
-        """Анализ торговых условий"""
-        signals = []
-        reasons = []
+        """Анализ торговых условий -> (тип, уверенность, части причины)"""
+        # Условия сразу копятся по сторонам - без общего списка и повторных проходов. Причины хранятся
+        # как (код REASON_TEMPLATES, аргументы) и форматируются в _format_reason только для отправляемого сигнала
+        buy_confidence = 0.0
+        buy_reasons = []
+        sell_confidence = 0.0
+        sell_reasons = []
         
         try:
             current_price = indicators.get("current_price", 0)
             if not current_price:
-                return "HOLD", 0.0, "Нет данных о текущей цене"
+                return "HOLD", 0.0, (("NO_PRICE", ()),)
             
             # 1. RSI анализ
             rsi = indicators.get("rsi", 50)
-            if rsi <= self.settings.RSI_OVERSOLD:
-                signals.append(("BUY", 0.8, f"RSI пересыщен: {rsi:.1f}"))
-            elif rsi >= self.settings.RSI_OVERBOUGHT:
-                signals.append(("SELL", 0.8, f"RSI перекуплен: {rsi:.1f}"))
+            if rsi <= self._rsi_oversold:
+                buy_confidence += 0.8
+                buy_reasons.append(("RSI_OVERSOLD", (rsi,)))
+            elif rsi >= self._rsi_overbought:
+                sell_confidence += 0.8
+                sell_reasons.append(("RSI_OVERBOUGHT", (rsi,)))
             
             # 2. Moving Average анализ
             sma_short = indicators.get("sma_short", 0)
@@ -148,18 +228,22 @@ class SignalProcessor:
             
             if sma_short and sma_long:
                 if sma_short > sma_long and current_price > sma_short:
-                    signals.append(("BUY", 0.6, f"Цена выше коротких MA (короткая: {sma_short:.2f}, длинная: {sma_long:.2f})"))
+                    buy_confidence += 0.6
+                    buy_reasons.append(("MA_ABOVE", (sma_short, sma_long)))
                 elif sma_short < sma_long and current_price < sma_short:
-                    signals.append(("SELL", 0.6, f"Цена ниже коротких MA (короткая: {sma_short:.2f}, длинная: {sma_long:.2f})"))
+                    sell_confidence += 0.6
+                    sell_reasons.append(("MA_BELOW", (sma_short, sma_long)))
             
             # 3. MACD анализ
             macd = indicators.get("macd", 0)
             macd_signal = indicators.get("macd_signal", 0)
             if macd and macd_signal:
                 if macd > macd_signal and macd > 0:
-                    signals.append(("BUY", 0.5, f"MACD бычий (MACD: {macd:.4f} > Signal: {macd_signal:.4f})"))
+                    buy_confidence += 0.5
+                    buy_reasons.append(("MACD_BULLISH", (macd, macd_signal)))
                 elif macd < macd_signal and macd < 0:
-                    signals.append(("SELL", 0.5, f"MACD медвежий (MACD: {macd:.4f} < Signal: {macd_signal:.4f})"))
+                    sell_confidence += 0.5
+                    sell_reasons.append(("MACD_BEARISH", (macd, macd_signal)))
             
             # 4. Bollinger Bands анализ
             bb_upper = indicators.get("bb_upper", 0)
@@ -168,163 +252,194 @@ class SignalProcessor:
             
             if bb_upper and bb_lower:
                 if current_price <= bb_lower:
-                    signals.append(("BUY", 0.7, f"Цена касается нижней полосы Боллинджера ({current_price:.2f} <= {bb_lower:.2f})"))
+                    buy_confidence += 0.7
+                    buy_reasons.append(("BB_LOWER", (current_price, bb_lower)))
                 elif current_price >= bb_upper:
-                    signals.append(("SELL", 0.7, f"Цена касается верхней полосы Боллинджера ({current_price:.2f} >= {bb_upper:.2f})"))
-            
-            # 5. Анализ объема
-            volume_boost = self._analyze_volume(indicators, trades)
-            
-            # 6. Анализ orderbook
-            orderbook_signal = self._analyze_orderbook_imbalance(orderbook)
-            if orderbook_signal:
-                signals.append(orderbook_signal)
-            
-            # 7. Анализ momentum
-            momentum_signal = self._analyze_price_momentum(indicators)
-            if momentum_signal:
-                signals.append(momentum_signal)
+                    sell_confidence += 0.7
+                    sell_reasons.append(("BB_UPPER", (current_price, bb_upper)))
+            
+            # 5. Анализ объема (помощники вызываются только при наличии своих данных)
+            volume_boost = self._analyze_volume(indicators, trades) if len(trades) >= 10 else 0
+            
+            # 6. Анализ orderbook, 7. Анализ momentum
+            extra_signals = []
+            if orderbook:
+                extra_signals.append(self._analyze_orderbook_imbalance(orderbook))
+            if indicators.get("ema_short") and indicators.get("ema_long"):
+                extra_signals.append(self._analyze_price_momentum(indicators))
+            
+            for extra_signal in extra_signals:
+                if extra_signal:
+                    side, confidence, reason = extra_signal
+                    if side == "BUY":
+                        buy_confidence += confidence
+                        buy_reasons.append(reason)
+                    else:
+                        sell_confidence += confidence
+                        sell_reasons.append(reason)
             
             # Объединяем сигналы
-            if not signals:
-                return "HOLD", 0.0, "Нет четких торговых сигналов"
-            
-            # Группируем по типу
-            buy_signals = [s for s in signals if s[0] == "BUY"]
-            sell_signals = [s for s in signals if s[0] == "SELL"]
-            
-            if len(buy_signals) > len(sell_signals):
-                avg_confidence = sum(s[1] for s in buy_signals) / len(buy_signals)
-                total_confidence = min(avg_confidence + volume_boost, 1.0)
-                combined_reason = " + ".join([s[2] for s in buy_signals[:3]])  # Топ 3 причины
-                return "BUY", total_confidence, combined_reason
+            buy_count = len(buy_reasons)
+            sell_count = len(sell_reasons)
+            if not buy_count and not sell_count:
+                return "HOLD", 0.0, (("NO_SIGNALS", ()),)
+            
+            if buy_count > sell_count:
+                total_confidence = min(buy_confidence / buy_count + volume_boost, 1.0)
+                return "BUY", total_confidence, buy_reasons[:3]  # Топ 3 причины
                 
-            elif len(sell_signals) > len(buy_signals):
-                avg_confidence = sum(s[1] for s in sell_signals) / len(sell_signals)
-                total_confidence = min(avg_confidence + volume_boost, 1.0)
-                combined_reason = " + ".join([s[2] for s in sell_signals[:3]])  # Топ 3 причины
-                return "SELL", total_confidence, combined_reason
+            elif sell_count > buy_count:
+                total_confidence = min(sell_confidence / sell_count + volume_boost, 1.0)
+                return "SELL", total_confidence, sell_reasons[:3]  # Топ 3 причины
                 
             else:
-                return "HOLD", 0.0, "Противоречивые сигналы (покупка/продажа сбалансированы)"
+                return "HOLD", 0.0, (("CONFLICTING", ()),)
                 
         except Exception as e:
             self.logger.error(f"Ошибка анализа торговых условий: {e}")
-            return "HOLD", 0.0, f"Ошибка анализа: {e}"
+            return "HOLD", 0.0, (("ERROR", (e,)),)
+    
+    @staticmethod
+    def _format_reason(reason_parts) -> str:
+        """Сборка текста причины из частей (код шаблона, аргументы)"""
+        return " + ".join(REASON_TEMPLATES[code] % args for code, args in reason_parts)
     
     def _analyze_volume(self, indicators: Dict, trades: List) -> float:
         """Анализ объема для усиления сигнала"""
-        try:
-            current_volume = indicators.get("current_volume", 0)
-            
-            if not trades or len(trades) < 10:
-                return 0
-            
-            # Средний объем за последние сделки
-            recent_volumes = [t.get("size", 0) for t in trades[-10:]]
-            avg_volume = sum(recent_volumes) / len(recent_volumes)
-            
-            # Усиливаем сигнал если текущий объем выше среднего
-            if current_volume > avg_volume * 1.5:
-                return 0.1  # Бонус к уверенности
-            elif current_volume > avg_volume * 2.0:
-                return 0.15  # Больший бонус
-            
-            return 0
-            
-        except Exception as e:
-            self.logger.debug(f"Ошибка анализа объема: {e}")
+        if not trades or len(trades) < 10:
             return 0
+        
+        current_volume = indicators.get("current_volume", 0)
+        
+        # Средний объем за последние 10 сделок
+        avg_volume = self._recent_volume_average(trades)
+        
+        # Усиливаем сигнал если текущий объем выше среднего
+        if current_volume > avg_volume * 1.5:
+            return 0.1  # Бонус к уверенности
+        elif current_volume > avg_volume * 2.0:
+            return 0.15  # Больший бонус
+        
+        return 0
+    
+    def _recent_volume_average(self, trades) -> float:
+        """Средний объем последних 10 сделок по скользящему окну"""
+        window = self._volume_window
+        tail = trades[-10:]
+        
+        # В окно добавляются только сделки новее последней учтенной (по trade_id); без id окно заполняется заново
+        start = 0
+        last_trade_id = self._volume_last_trade_id
+        if last_trade_id is not None:
+            for index in range(len(tail) - 1, -1, -1):
+                if tail[index].get("trade_id") == last_trade_id:
+                    start = index + 1
+                    break
+        
+        for index in range(start, len(tail)):
+            window.push(tail[index].get("size", 0))
+        self._volume_last_trade_id = tail[-1].get("trade_id")
+        
+        return window.mean()
     
     def _analyze_orderbook_imbalance(self, orderbook: Dict) -> Optional[tuple]:
         """Анализ дисбаланса ордербука"""
-        try:
-            order_imbalance = orderbook.get("order_imbalance", 0)
-            
-            if order_imbalance > 0.3:
-                return ("BUY", 0.4, f"Сильный дисбаланс в пользу покупок ({order_imbalance:.2%})")
-            elif order_imbalance < -0.3:
-                return ("SELL", 0.4, f"Сильный дисбаланс в пользу продаж ({order_imbalance:.2%})")
-            
-            return None
-            
-        except Exception as e:
-            self.logger.debug(f"Ошибка анализа orderbook imbalance: {e}")
+        if not orderbook:
             return None
+        
+        order_imbalance = orderbook.get("order_imbalance") or 0
+        
+        if order_imbalance > 0.3:
+            return ("BUY", 0.4, ("ORDERBOOK_BUY", (order_imbalance * 100,)))
+        elif order_imbalance < -0.3:
+            return ("SELL", 0.4, ("ORDERBOOK_SELL", (order_imbalance * 100,)))
+        
+        return None
     
     def _analyze_price_momentum(self, indicators: Dict) -> Optional[tuple]:
         """Анализ ценового momentum"""
-        try:
-            ema_short = indicators.get("ema_short", 0)
-            ema_long = indicators.get("ema_long", 0)
-            current_price = indicators.get("current_price", 0)
-            
-            if not (ema_short and ema_long and current_price):
-                return None
-            
-            # Сильный momentum если цена значительно выше/ниже EMA
-            short_deviation = (current_price - ema_short) / ema_short if ema_short else 0
-            long_deviation = (current_price - ema_long) / ema_long if ema_long else 0
-            
-            if short_deviation > 0.02 and long_deviation > 0.01:  # 2% и 1%
-                return ("BUY", 0.3, f"Сильный восходящий momentum (цена выше EMA на {short_deviation:.2%})")
-            elif short_deviation < -0.02 and long_deviation < -0.01:
-                return ("SELL", 0.3, f"Сильный нисходящий momentum (цена ниже EMA на {abs(short_deviation):.2%})")
-            
-            return None
-            
-        except Exception as e:
-            self.logger.debug(f"Ошибка анализа momentum: {e}")
+        ema_short = indicators.get("ema_short", 0)
+        ema_long = indicators.get("ema_long", 0)
+        current_price = indicators.get("current_price", 0)
+        
+        if not (ema_short and ema_long and current_price):
             return None
-    
-    def _is_signal_cooldown(self) -> bool:
-        """Проверка cooldown между сигналами"""
-        if not self.last_signal_time:
-            return False
         
-        cooldown_minutes = self.settings.SIGNAL_COOLDOWN_MINUTES
-        time_diff = datetime.now() - self.last_signal_time
+        # Сильный momentum если цена значительно выше/ниже EMA
+        short_deviation = (current_price - ema_short) / ema_short
+        long_deviation = (current_price - ema_long) / ema_long
         
-        return time_diff < timedelta(minutes=cooldown_minutes)
+        if short_deviation > 0.02 and long_deviation > 0.01:  # 2% и 1%
+            return ("BUY", 0.3, ("MOMENTUM_UP", (short_deviation * 100,)))
+        elif short_deviation < -0.02 and long_deviation < -0.01:
+            return ("SELL", 0.3, ("MOMENTUM_DOWN", (abs(short_deviation) * 100,)))
+        
+        return None
+    
+    def _is_signal_cooldown(self) -> bool:
+        """Проверка cooldown между сигналами (по монотонным часам)"""
+        last_signal = self._last_signal_monotonic
+        return last_signal is not None and time.monotonic() - last_signal < self._cooldown_seconds
     
     def get_recent_signals(self, limit: int = 10) -> List[Dict]:
         """Получение последних сигналов"""
         try:
-            recent_signals = self.signals_history[-limit:] if self.signals_history else []
+            history = self.signals_history
+            recent_signals = islice(history, max(len(history) - limit, 0), None)
             return [self._signal_to_dict(signal) for signal in recent_signals]
             
         except Exception as e:
             self.logger.error(f"Ошибка получения recent signals: {e}")
             return []
     
+    def _count_signal(self, signal: TradingSignal, sign: int):
+        """Учет сигнала в счетчиках статистики: sign=1 при добавлении, -1 при вытеснении"""
+        if signal.signal_type in self._signal_counts:
+            self._signal_counts[signal.signal_type] += sign
+        self._confidence_sum += sign * signal.confidence
+        if not self.signals_history:
+            self._confidence_sum = 0.0  # пустая история - без остатка округления
+        elif sign > 0:
+            # Раз в размер истории сумма пересчитывается точно (как в RollingWindow) - ошибка округления
+            # не накапливается; только при добавлении: вытесняемый сигнал к этому моменту еще в deque
+            self._confidence_adds += 1
+            if self._confidence_adds >= self.signals_history.maxlen:
+                self._confidence_adds = 0
+                self._confidence_sum = sum(s.confidence for s in self.signals_history)
+        
+        # Сигналы идут по времени: новый день обнуляет счетчик "сегодня"
+        day = signal.timestamp.date()
+        if day == self._today_date:
+            self._today_count += sign
+        elif sign > 0 and (self._today_date is None or day > self._today_date):
+            self._today_date = day
+            self._today_count = 1
+    
     def get_signal_statistics(self) -> Dict:
-        """Статистика по сигналам"""
+        """Статистика по сигналам (из счетчиков, без прохода по истории)"""
         try:
             if not self.signals_history:
                 return {}
             
-            total_signals = len(self.signals_history)
-            buy_signals = [s for s in self.signals_history if s.signal_type == "BUY"]
-            sell_signals = [s for s in self.signals_history if s.signal_type == "SELL"]
+            now = datetime.now()
+            buy_count = self._signal_counts["BUY"]
+            sell_count = self._signal_counts["SELL"]
+            today_count = self._today_count if self._today_date == now.date() else 0
+            confidence_sum = self._confidence_sum
             
-            # Статистика за сегодня
-            today = datetime.now().date()
-            today_signals = [s for s in self.signals_history if s.timestamp.date() == today]
-            
-            # Средняя уверенность
-            avg_confidence = sum(s.confidence for s in self.signals_history) / total_signals
+            total_signals = len(self.signals_history)
             
             return {
                 "total_signals": total_signals,
-                "buy_signals": len(buy_signals),
-                "sell_signals": len(sell_signals),
-                "signals_today": len(today_signals),
-                "average_confidence": avg_confidence,
+                "buy_signals": buy_count,
+                "sell_signals": sell_count,
+                "signals_today": today_count,
+                "average_confidence": confidence_sum / total_signals,
                 "last_signal_time": self.last_signal_time.isoformat() if self.last_signal_time else None,
                 "cooldown_active": self._is_signal_cooldown(),
                 "signal_types_distribution": {
-                    "BUY": len(buy_signals) / total_signals,
-                    "SELL": len(sell_signals) / total_signals
+                    "BUY": buy_count / total_signals,
+                    "SELL": sell_count / total_signals
                 }
             }
             
@@ -357,12 +472,12 @@ class SignalProcessor:
         try:
             cutoff_date = datetime.now() - timedelta(days=max_age_days)
             
-            old_count = len(self.signals_history)
-            self.signals_history = [
-                s for s in self.signals_history 
-                if s.timestamp > cutoff_date
-            ]
-            new_count = len(self.signals_history)
+            # История упорядочена по времени: старые сигналы снимаются с головы, без пересборки deque и счетчиков
+            history = self.signals_history
+            old_count = len(history)
+            while history and history[0].timestamp <= cutoff_date:
+                self._count_signal(history.popleft(), -1)
+            new_count = len(history)
             
             if old_count > new_count:
                 self.logger.info(f"Очищено {old_count - new_count} старых сигналов (старше {max_age_days} дней)")
@@ -382,20 +497,21 @@ class SignalProcessor:
             # Проверяем качество данных
             klines = market_data.get("recent_klines", [])
             if len(klines) < 30:
-                validation_result["issues"].append(f"Недостаточно kline данных: {len(klines)}/30")
+                validation_result["issues"].append(_MSG_FEW_KLINES % len(klines))
                 validation_result["can_generate_signals"] = False
             
             # Проверяем свежесть данных
-            metadata = market_data.get("metadata", {})
-            data_quality = metadata.get("data_quality", {})
+            metadata = market_data.get("metadata")
+            data_quality = metadata.get("data_quality") if metadata else None
             
-            for data_type, quality_info in data_quality.items():
-                if isinstance(quality_info, dict) and not quality_info.get("is_fresh", True):
-                    validation_result["issues"].append(f"Устаревшие данные: {data_type}")
+            if data_quality:
+                for data_type, quality_info in data_quality.items():
+                    if isinstance(quality_info, dict) and not quality_info.get("is_fresh", True):
+                        validation_result["issues"].append(_MSG_STALE_DATA % (data_type,))
             
             # Проверяем cooldown
             if self._is_signal_cooldown():
-                validation_result["issues"].append(f"Активен cooldown сигналов ({self.settings.SIGNAL_COOLDOWN_MINUTES} мин)")
+                validation_result["issues"].append(_MSG_COOLDOWN % self.settings.SIGNAL_COOLDOWN_MINUTES)
                 validation_result["can_generate_signals"] = False
             
             # Рекомендации
@@ -5,17 +5,29 @@ WebSocket менеджер для подключения к Bybit
 """
 
 import asyncio
-import json
 import logging
 import time
 import math
+from collections import deque, namedtuple
 from datetime import datetime, timedelta
-from typing import Dict, List, Optional, Callable, Any
+from itertools import islice
+from operator import itemgetter
+from typing import Dict, List, Optional, Callable, Any, Tuple
+import orjson
 import websockets
-from websockets.exceptions import ConnectionClosed, WebSocketException
+from websockets.exceptions import ConnectionClosed, ConnectionClosedOK, WebSocketException
+from websockets.protocol import State
 import httpx
 
 from config.settings import get_settings
+from core.data_processor import _RecordAccess, normalize_side, tail, ts_to_datetime
+
+
+class TradeRecord(_RecordAccess, namedtuple("TradeRecord", (
+    "timestamp", "price", "size", "side", "trade_id", "value", "is_large"
+))):
+    """Компактная запись сделки (tuple вместо dict из 7 ключей); t["size"] и t.get() сохранены для читателей"""
+    __slots__ = ()
 
 
 class WebSocketManager:
@@ -36,28 +48,38 @@ class WebSocketManager:
         # HTTP клиент для REST API запросов
         self.http_client = httpx.AsyncClient(timeout=10.0)
         
+        # Лимиты данных
+        self.max_klines = self.settings.KLINE_LIMIT
+        self.max_trades = 1000
+        self.max_extended_klines = self.settings.AI_KLINES_COUNT
+        self.max_orderbook_history = 50
+        self.max_price_levels = 20
+        
         # Хранение данных
         self.ticker_data = {}
-        self.kline_data = []
+        self._ticker_fmt: Optional[dict] = None  # строки get_market_data для текущего ticker_data
+        # Свечи и сделки - кольцевые буферы: maxlen вытесняет старые записи без копирования
+        self.kline_data = deque(maxlen=self.max_klines)
         self.orderbook_data = {}
-        self.trade_data = []
+        self.trade_data = deque(maxlen=self.max_trades)
         
-        # Расширенное хранение для ИИ-анализа
-        self.extended_kline_data = []
-        self.extended_orderbook_history = []
+        # Расширенное хранение для ИИ-анализа (кольцевые буферы: старые записи вытесняются без копирования)
+        self.extended_kline_data = deque(maxlen=self.max_extended_klines)
+        self.extended_orderbook_history = deque(maxlen=self.max_orderbook_history)
         self.volume_profile = {}
-        self.price_levels = {"support": [], "resistance": []}
+        self.price_levels = {
+            "support": deque(maxlen=self.max_price_levels),
+            "resistance": deque(maxlen=self.max_price_levels)
+        }
         
         # Задачи asyncio
         self.ping_task = None
         self.reconnect_task = None
         self.main_task = None
         
-        # Лимиты данных
-        self.max_klines = self.settings.KLINE_LIMIT
-        self.max_trades = 1000
-        self.max_extended_klines = self.settings.AI_KLINES_COUNT
-        self.max_orderbook_history = 50
+        # Очередь пакетов свечей для стратегии (один долгоживущий обработчик вместо ожидания в цикле приема)
+        self._signal_queue: Optional[asyncio.Queue] = None
+        self._signal_worker: Optional[asyncio.Task] = None
         
         # Счетчики для диагностики
         self.message_counts = {
@@ -83,6 +105,10 @@ class WebSocketManager:
             self.logger.info(f"   Символ: {self.symbol}")
             self.logger.info(f"   Таймфрейм: {self.settings.STRATEGY_TIMEFRAME}")
             
+            # Обработчик свечей для стратегии
+            self._signal_queue = asyncio.Queue(maxsize=64)
+            self._signal_worker = asyncio.create_task(self._signal_loop())
+            
             # Запуск основной задачи
             self.main_task = asyncio.create_task(self._main_loop())
             
@@ -109,28 +135,53 @@ class WebSocketManager:
             
             self.is_connected = False
             
-            # Отмена всех задач
-            if self.main_task and not self.main_task.done():
-                self.main_task.cancel()
+            # Отмена всех задач и ожидание их завершения (не дольше секунды)
+            tasks = [
+                task for task in (self.main_task, self.ping_task, self.reconnect_task, self._signal_worker)
+                if task and not task.done()
+            ]
+            for task in tasks:
+                task.cancel()
             
-            if self.ping_task and not self.ping_task.done():
-                self.ping_task.cancel()
+            if tasks:
+                try:
+                    await asyncio.wait_for(asyncio.gather(*tasks, return_exceptions=True), timeout=1.0)
+                except asyncio.TimeoutError:
+                    self.logger.warning("Не все задачи WebSocket завершились за 1 секунду")
             
-            if self.reconnect_task and not self.reconnect_task.done():
-                self.reconnect_task.cancel()
+            self.main_task = self.ping_task = self.reconnect_task = None
+            self._signal_worker = None
+            self._signal_queue = None
             
             # Закрытие WebSocket соединения
             if self.websocket:
                 await self.websocket.close()
+                self.websocket = None
             
             # Закрытие HTTP клиента
             await self.http_client.aclose()
+            
+            # Освобождаем накопленные данные
+            self._release_market_data()
                 
             self.logger.info("WebSocket соединение закрыто")
             
         except Exception as e:
             self.logger.error(f"Ошибка закрытия WebSocket: {e}")
     
+    def _release_market_data(self):
+        """Очистка буферов рыночных данных при остановке"""
+        self.ticker_data = {}
+        self._ticker_fmt = None
+        self.kline_data.clear()
+        self.orderbook_data = {}
+        self.trade_data.clear()
+        self.extended_kline_data.clear()
+        self.extended_orderbook_history.clear()
+        self.volume_profile.clear()
+        self.price_levels["support"].clear()
+        self.price_levels["resistance"].clear()
+    
     async def get_fresh_ticker_data(self) -> dict:
         """Получение свежих ticker данных через HTTP REST API"""
         try:
@@ -202,7 +253,11 @@ class WebSocketManager:
                 self.settings.websocket_url,
                 ping_interval=None,
                 ping_timeout=None,
-                close_timeout=10
+                close_timeout=10,
+                max_size=2 ** 22,  # снимки orderbook крупнее лимита по умолчанию (1 MiB) не рвут соединение
+                compression=None,  # без permessage-deflate: нет zlib на каждом кадре
+                max_queue=None,  # без flow control по входящим кадрам: всплески orderbook/trade не тормозят чтение
+                write_limit=2 ** 20  # верхняя граница буфера записи, байты
             )
             
             self.logger.info(f"WebSocket подключен к {self.settings.websocket_url}")
@@ -221,7 +276,7 @@ class WebSocketManager:
                 "args": subscriptions
             }
             
-            await self.websocket.send(json.dumps(subscribe_message))
+            await self.websocket.send(orjson.dumps(subscribe_message).decode())
             self.logger.info("Запрос подписки отправлен (БЕЗ ticker - используем HTTP)")
             
             # Запуск ping задачи (отправка ping от клиента каждые 20 сек)
@@ -241,7 +296,16 @@ class WebSocketManager:
         """Прослушивание сообщений WebSocket"""
         self.logger.info("Начинаем прослушивание сообщений...")
         
-        async for message in self.websocket:
+        # asyncio-клиент websockets>=14 отдает текстовый кадр как bytes: orjson разбирает их без промежуточной str
+        recv = self.websocket.recv
+        
+        while True:
+            try:
+                message = await recv(decode=False)
+            except ConnectionClosedOK:
+                self.logger.info("WebSocket соединение закрыто сервером")
+                return
+            
             try:
                 self.message_counts["total"] += 1
                 
@@ -249,7 +313,7 @@ class WebSocketManager:
                 if self.message_counts["total"] <= 10 or self.message_counts["total"] % 100 == 0:
                     self.logger.info(f"Сообщение #{self.message_counts['total']}: {message[:200]}...")
                 
-                data = json.loads(message)
+                data = orjson.loads(message)
                 await self._handle_message(data)
                 self.last_data_time = time.time()
                 
@@ -257,7 +321,7 @@ class WebSocketManager:
                 if self.message_counts["total"] % 50 == 0:
                     self._log_message_statistics()
                 
-            except json.JSONDecodeError as e:
+            except orjson.JSONDecodeError as e:
                 self.logger.error(f"Ошибка парсинга JSON: {e}, сообщение: {message}")
             except Exception as e:
                 self.logger.error(f"Ошибка обработки сообщения: {e}")
@@ -285,7 +349,7 @@ class WebSocketManager:
                 self.message_counts["ping"] += 1
                 # Отвечаем на ping сервера с теми же args
                 pong_message = {"op": "pong", "args": data.get("args", [])}
-                await self.websocket.send(json.dumps(pong_message))
+                await self.websocket.send(orjson.dumps(pong_message).decode())
                 self.logger.debug(f"Ответили pong на ping: {data.get('args', [])}")
                 return
                 
@@ -300,7 +364,7 @@ class WebSocketManager:
             
             # Обработка данных по топикам
             if topic:
-                self.logger.debug(f"Топик: '{topic}', размер данных: {len(data.get('data', []))}")
+                self.logger.debug("Топик: '%s', размер данных: %d", topic, len(data.get('data', [])))
                 
                 if topic.startswith("tickers."):
                     # ИГНОРИРУЕМ ticker данные из WebSocket
@@ -320,67 +384,91 @@ class WebSocketManager:
                     self.logger.warning(f"Неизвестный топик: {topic}")
             else:
                 self.message_counts["unknown"] += 1
-                self.logger.warning(f"Сообщение без топика: {json.dumps(data)[:200]}...")
+                self.logger.warning(f"Сообщение без топика: {orjson.dumps(data)[:200].decode(errors='replace')}...")
         
         except Exception as e:
             self.logger.error(f"Ошибка обработки сообщения: {e}")
     
     async def _handle_kline_data(self, data: dict):
         """Обработка kline (свечи) данных"""
+        # Атрибуты, используемые в цикле, связываются локально один раз на кадр
+        logger = self.logger
         try:
-            self.logger.debug("Обработка kline данных...")
+            logger.debug("Обработка kline данных...")
             klines = data.get("data", [])
             
             if not klines:
-                self.logger.warning("Пустые kline данные")
+                logger.warning("Пустые kline данные")
                 return
             
-            self.logger.info(f"Получено {len(klines)} свечей")
+            logger.info(f"Получено {len(klines)} свечей")
+            
+            parse_kline = self._parse_kline
+            debug = logger.isEnabledFor(logging.DEBUG)
+            confirmed = []
             
             for kline_info in klines:
-                kline = {
-                    "timestamp": int(kline_info.get("start", 0)),
-                    "datetime": datetime.fromtimestamp(int(kline_info.get("start", 0)) / 1000),
-                    "open": float(kline_info.get("open", 0)),
-                    "high": float(kline_info.get("high", 0)),
-                    "low": float(kline_info.get("low", 0)),
-                    "close": float(kline_info.get("close", 0)),
-                    "volume": float(kline_info.get("volume", 0)),
-                    "confirm": kline_info.get("confirm", False)
-                }
+                kline = parse_kline(kline_info)
                 
-                self.logger.debug(f"Kline: {kline['datetime']}, OHLC: {kline['open']}/{kline['high']}/{kline['low']}/{kline['close']}, confirm: {kline['confirm']}")
+                if debug:
+                    logger.debug(
+                        "Kline: %s, OHLC: %s/%s/%s/%s, confirm: %s", ts_to_datetime(kline["timestamp"]),
+                        kline['open'], kline['high'], kline['low'], kline['close'], kline['confirm']
+                    )
                 
                 # Добавляем только подтвержденные свечи
                 if kline["confirm"]:
-                    self.logger.info(f"Добавляем подтвержденную свечу: close=${kline['close']}")
-                    
-                    # Обычное хранение
-                    self.kline_data.append(kline)
-                    if len(self.kline_data) > self.max_klines:
-                        self.kline_data = self.kline_data[-self.max_klines:]
+                    logger.info(f"Добавляем подтвержденную свечу: close=${kline['close']}")
+                    confirmed.append(kline)
                     
                     # Расширенное хранение для ИИ-анализа
                     enhanced_kline = self._enhance_kline_data(kline)
                     self.extended_kline_data.append(enhanced_kline)
-                    if len(self.extended_kline_data) > self.max_extended_klines:
-                        self.extended_kline_data = self.extended_kline_data[-self.max_extended_klines:]
                     
                     # Обновляем уровни поддержки/сопротивления
                     self._update_price_levels(kline)
-                    
-                    self.logger.info(f"Всего свечей в памяти: обычных={len(self.kline_data)}, расширенных={len(self.extended_kline_data)}")
-                
-                # Обновляем стратегию
-                if self.strategy:
-                    signal = await self.strategy.analyze_kline(kline)
-                    if signal and self.on_signal_callback:
-                        await self.on_signal_callback(signal)
+            
+            if not confirmed:
+                return
+            
+            # Обычное хранение одним вызовом на кадр (кольцевой буфер сам вытесняет старые свечи)
+            self.kline_data.extend(confirmed)
+            logger.info(f"Всего свечей в памяти: обычных={len(self.kline_data)}, расширенных={len(self.extended_kline_data)}")
+            
+            # Передаем свечи кадра стратегии одним пакетом через очередь (цикл приема не ждет анализа);
+            # неподтвержденные обновления сигналов не дают и в очередь не попадают
+            if self.strategy and self._signal_queue is not None:
+                try:
+                    self._signal_queue.put_nowait(confirmed)
+                except asyncio.QueueFull:
+                    logger.warning("Очередь анализа свечей переполнена, пропущено свечей: %d", len(confirmed))
                 
         except Exception as e:
             self.logger.error(f"Ошибка обработки kline: {e}")
             self.logger.error(f"Kline данные: {data}")
     
+    async def _signal_loop(self):
+        """Последовательный анализ пакетов свечей стратегией"""
+        while True:
+            klines = await self._signal_queue.get()
+            await self._process_strategy_signals(klines)
+    
+    async def _process_strategy_signals(self, klines: List[dict]):
+        """Анализ пакета свечей стратегией и отправка сигналов"""
+        try:
+            signals = await self.strategy.analyze_klines(klines)
+            if not signals or not self.on_signal_callback:
+                return
+            
+            results = await asyncio.gather(
+                *(self.on_signal_callback(signal) for signal in signals), return_exceptions=True
+            )
+            for result in results:
+                if isinstance(result, Exception):
+                    self.logger.error(f"Ошибка отправки сигнала: {result}")
+        except Exception as e:
+            self.logger.error(f"Ошибка анализа свечей стратегией: {e}")
+    
     def _enhance_kline_data(self, kline: dict) -> dict:
         """Расширение данных свечи для ИИ-анализа"""
         enhanced = kline.copy()
@@ -429,30 +517,23 @@ class WebSocketManager:
             high_price = kline["high"]
             low_price = kline["low"]
             
-            # Простое определение уровней
+            # Простое определение уровней (количество уровней ограничено maxlen буферов)
             if len(self.extended_kline_data) >= 3:
-                recent_highs = [k["high"] for k in self.extended_kline_data[-3:]]
-                if high_price == max(recent_highs):
+                recent_klines = list(islice(reversed(self.extended_kline_data), 3))
+                
+                if high_price == max(k["high"] for k in recent_klines):
                     self.price_levels["resistance"].append({
                         "price": high_price,
                         "timestamp": kline["timestamp"],
                         "strength": 1
                     })
-            
-            if len(self.extended_kline_data) >= 3:
-                recent_lows = [k["low"] for k in self.extended_kline_data[-3:]]
-                if low_price == min(recent_lows):
+                
+                if low_price == min(k["low"] for k in recent_klines):
                     self.price_levels["support"].append({
                         "price": low_price,
                         "timestamp": kline["timestamp"],
                         "strength": 1
                     })
-            
-            # Ограничиваем количество уровней
-            if len(self.price_levels["resistance"]) > 20:
-                self.price_levels["resistance"] = self.price_levels["resistance"][-20:]
-            if len(self.price_levels["support"]) > 20:
-                self.price_levels["support"] = self.price_levels["support"][-20:]
                 
         except Exception as e:
             self.logger.error(f"Ошибка обновления уровней цен: {e}")
@@ -467,16 +548,24 @@ class WebSocketManager:
                 self.logger.warning("Пустые orderbook данные")
                 return
             
-            bids = orderbook_info.get("b", [])
-            asks = orderbook_info.get("a", [])
+            # Схема Bybit v5 стабильна: стороны всегда в "b"/"a"; .get только при нестандартном кадре
+            try:
+                bids = orderbook_info["b"]
+                asks = orderbook_info["a"]
+            except KeyError:
+                bids = orderbook_info.get("b", [])
+                asks = orderbook_info.get("a", [])
             
-            self.logger.debug(f"Orderbook: {len(bids)} bids, {len(asks)} asks")
+            self.logger.debug("Orderbook: %d bids, %d asks", len(bids), len(asks))
             
             enhanced_orderbook = {
                 "symbol": self.symbol,
-                "bids": [[float(bid[0]), float(bid[1])] for bid in bids],
-                "asks": [[float(ask[0]), float(ask[1])] for ask in asks],
-                "timestamp": datetime.now().isoformat()
+                # Распаковка пары вместо двух индексаций; уровень - кортеж (price, size)
+                "bids": [(float(price), float(size)) for price, size in bids],
+                "asks": [(float(price), float(size)) for price, size in asks],
+                # ms int как у свечей и сделок: серверное время кадра ts, локальные часы - только если его нет;
+                # ISO строка собирается только в геттерах
+                "timestamp": data.get("ts") or time.time_ns() // 1_000_000
             }
             
             # Расширенный анализ ордербука
@@ -496,9 +585,6 @@ class WebSocketManager:
                 "imbalance": enhanced_orderbook.get("order_imbalance", 0)
             })
             
-            if len(self.extended_orderbook_history) > self.max_orderbook_history:
-                self.extended_orderbook_history = self.extended_orderbook_history[-self.max_orderbook_history:]
-            
             # Обновляем профиль объема
             self._update_volume_profile(enhanced_orderbook)
             
@@ -521,14 +607,15 @@ class WebSocketManager:
             if not bids or not asks:
                 return analysis
             
-            # Основные метрики
-            best_bid = float(bids[0][0]) if bids else 0
-            best_ask = float(asks[0][0]) if asks else 0
+            # Основные метрики (уровни уже float после разбора в _handle_orderbook_data)
+            best_bid = bids[0][0]
+            best_ask = asks[0][0]
             spread = best_ask - best_bid
             
-            # Объемы
-            total_bid_volume = sum(float(bid[1]) for bid in bids)
-            total_ask_volume = sum(float(ask[1]) for ask in asks)
+            # Объемы: сумма по столбцу размеров
+            size_column = itemgetter(1)
+            total_bid_volume = sum(map(size_column, bids))
+            total_ask_volume = sum(map(size_column, asks))
             
             # Дисбаланс ордеров
             order_imbalance = (total_bid_volume - total_ask_volume) / (total_bid_volume + total_ask_volume) if (total_bid_volume + total_ask_volume) > 0 else 0
@@ -556,27 +643,15 @@ class WebSocketManager:
             bids = orderbook.get("bids", [])
             asks = orderbook.get("asks", [])
             
-            for bid in bids[:10]:
-                price = float(bid[0])
-                volume = float(bid[1])
-                price_level = round(price, 2)
-                
-                if price_level not in self.volume_profile:
-                    self.volume_profile[price_level] = {"bid_volume": 0, "ask_volume": 0, "total_volume": 0}
-                
-                self.volume_profile[price_level]["bid_volume"] += volume
-                self.volume_profile[price_level]["total_volume"] += volume
-            
-            for ask in asks[:10]:
-                price = float(ask[0])
-                volume = float(ask[1])
-                price_level = round(price, 2)
-                
-                if price_level not in self.volume_profile:
-                    self.volume_profile[price_level] = {"bid_volume": 0, "ask_volume": 0, "total_volume": 0}
-                
-                self.volume_profile[price_level]["ask_volume"] += volume
-                self.volume_profile[price_level]["total_volume"] += volume
+            for levels, side_key in ((bids, "bid_volume"), (asks, "ask_volume")):
+                for price, volume in levels[:10]:
+                    price_level = round(price, 2)
+                    
+                    if price_level not in self.volume_profile:
+                        self.volume_profile[price_level] = {"bid_volume": 0, "ask_volume": 0, "total_volume": 0}
+                    
+                    self.volume_profile[price_level][side_key] += volume
+                    self.volume_profile[price_level]["total_volume"] += volume
             
             # Ограничиваем размер профиля объема
             if len(self.volume_profile) > 100:
@@ -596,29 +671,26 @@ class WebSocketManager:
                 self.logger.warning("Пустые trade данные")
                 return
             
-            self.logger.debug(f"Получено {len(trades)} сделок")
+            self.logger.debug("Получено %d сделок", len(trades))
+            
+            # Порог крупной сделки считается один раз на пакет, а не на каждую сделку
+            large_trade_threshold = self._calculate_average_trade_size() * 2
+            
+            # Атрибуты, используемые в цикле, связываются локально один раз на пакет
+            trade_data = self.trade_data
+            append = trade_data.append
+            parse_trade = self._parse_trade
             
             for trade_info in trades:
-                trade = {
-                    "timestamp": int(trade_info.get("T", 0)),
-                    "datetime": datetime.fromtimestamp(int(trade_info.get("T", 0)) / 1000),
-                    "price": float(trade_info.get("p", 0)),
-                    "size": float(trade_info.get("v", 0)),
-                    "side": trade_info.get("S", ""),
-                    "trade_id": trade_info.get("i", "")
-                }
-                
-                # Добавляем расширенную информацию
-                trade["value"] = trade["price"] * trade["size"]
-                trade["is_large"] = trade["size"] > self._calculate_average_trade_size() * 2
+                trade_time, price, size, side, trade_id = parse_trade(trade_info)
                 
-                self.trade_data.append(trade)
-                
-                # Ограничиваем количество сделок
-                if len(self.trade_data) > self.max_trades:
-                    self.trade_data = self.trade_data[-self.max_trades:]
+                # Расширенная информация: value и is_large
+                append(TradeRecord(
+                    trade_time, price, size, normalize_side(side), trade_id,
+                    price * size, size > large_trade_threshold
+                ))
             
-            self.logger.info(f"Добавлено {len(trades)} сделок, всего в памяти: {len(self.trade_data)}")
+            self.logger.info(f"Добавлено {len(trades)} сделок, всего в памяти: {len(trade_data)}")
             
             # Обновляем стратегию
             if self.strategy:
@@ -628,12 +700,58 @@ class WebSocketManager:
             self.logger.error(f"Ошибка обработки trades: {e}")
             self.logger.error(f"Trade данные: {data}")
     
+    @staticmethod
+    def _parse_kline(kline_info: dict) -> dict:
+        """Свеча Bybit v5: прямое чтение известных полей, разбор через .get только при нестандартном формате"""
+        # start - JSON-число (ms), orjson уже отдает int; int() остается только в запасной ветке
+        try:
+            return {
+                "timestamp": kline_info["start"],
+                "open": float(kline_info["open"]),
+                "high": float(kline_info["high"]),
+                "low": float(kline_info["low"]),
+                "close": float(kline_info["close"]),
+                "volume": float(kline_info["volume"]),
+                "confirm": kline_info["confirm"]
+            }
+        except (KeyError, TypeError):
+            return {
+                "timestamp": int(kline_info.get("start", 0)),
+                "open": float(kline_info.get("open", 0)),
+                "high": float(kline_info.get("high", 0)),
+                "low": float(kline_info.get("low", 0)),
+                "close": float(kline_info.get("close", 0)),
+                "volume": float(kline_info.get("volume", 0)),
+                "confirm": kline_info.get("confirm", False)
+            }
+    
+    @staticmethod
+    def _parse_trade(trade_info: dict) -> Tuple[int, float, float, str, str]:
+        """Сделка Bybit v5 -> (время, цена, объем, сторона, id); .get только при нестандартном формате"""
+        # T - JSON-число (ms), orjson уже отдает int; int() остается только в запасной ветке
+        try:
+            return (
+                trade_info["T"],
+                float(trade_info["p"]),
+                float(trade_info["v"]),
+                trade_info["S"],
+                trade_info["i"]
+            )
+        except (KeyError, TypeError):
+            return (
+                int(trade_info.get("T", 0)),
+                float(trade_info.get("p", 0)),
+                float(trade_info.get("v", 0)),
+                trade_info.get("S", ""),
+                trade_info.get("i", "")
+            )
+    
     def _calculate_average_trade_size(self) -> float:
         """Вычисление среднего размера сделки"""
         if not self.trade_data:
             return 0
         
-        recent_trades = self.trade_data[-50:]
+        recent_trades = tail(self.trade_data, 50)
         total_size = sum(trade["size"] for trade in recent_trades)
         return total_size / len(recent_trades)
     
@@ -643,13 +761,13 @@ class WebSocketManager:
             try:
                 await asyncio.sleep(20)  # Каждые 20 секунд как рекомендует Bybit
                 
-                if self.websocket and not self.websocket.closed:
+                if self.websocket and self.websocket.state is State.OPEN:
                     # Отправляем ping от клиента
                     client_ping = {
                         "op": "ping", 
                         "args": [str(int(time.time() * 1000))]
                     }
-                    await self.websocket.send(json.dumps(client_ping))
+                    await self.websocket.send(orjson.dumps(client_ping).decode())
                     self.last_ping = time.time()
                     self.logger.debug(f"Отправлен client ping: {client_ping['args'][0]}")
                 
@@ -689,7 +807,17 @@ class WebSocketManager:
             self.logger.warning("ticker_data пуст и нет klines данных")
             return {}
         
-        # Остальной код остается прежним...
+        # Строки форматируются один раз при обновлении ticker_data, здесь только счетчики
+        if self._ticker_fmt is None:
+            self._ticker_fmt = self._format_ticker_data()
+        
+        market_data = self._ticker_fmt.copy()
+        market_data["klines_count"] = len(self.kline_data)
+        market_data["trades_count"] = len(self.trade_data)
+        return market_data
+    
+    def _format_ticker_data(self) -> dict:
+        """Отформатированные поля ticker_data для get_market_data"""
         change_24h = self.ticker_data.get("change_24h", 0)
         if change_24h > 2:
             trend = "bullish"
@@ -710,8 +838,6 @@ class WebSocketManager:
             "spread": f"{abs(self.ticker_data.get('ask', 0) - self.ticker_data.get('bid', 0)):.4f}",
             "timestamp": self.ticker_data.get("timestamp"),
             "trend": trend,
-            "klines_count": len(self.kline_data),
-            "trades_count": len(self.trade_data),
             "data_source": "ticker"
         }
     
@@ -824,6 +950,7 @@ class WebSocketManager:
                 "ask": summary["best_ask"],
                 "timestamp": datetime.now().isoformat()
             }
+            self._ticker_fmt = None
             
             self.logger.info(f"✅ HTTP ticker обработан: {summary['symbol']} @ ${summary['current_price']:.2f}")
             return summary
@@ -850,7 +977,7 @@ class WebSocketManager:
             return {}
         
         try:
-            recent_klines = self.extended_kline_data[-20:]
+            recent_klines = tail(self.extended_kline_data, 20)
             closes = [k["close"] for k in recent_klines]
             volumes = [k["volume"] for k in recent_klines]
             
@@ -878,7 +1005,10 @@ class WebSocketManager:
             return {}
         
         return {
-            "current_orderbook": self.orderbook_data,
+            "current_orderbook": {
+                **self.orderbook_data,
+                "timestamp": ts_to_datetime(self.orderbook_data["timestamp"]).isoformat()
+            },
             "top_levels": {
                 "bids": self.orderbook_data.get("bids", [])[:5],
                 "asks": self.orderbook_data.get("asks", [])[:5]
@@ -891,17 +1021,16 @@ class WebSocketManager:
             return {}
         
         try:
-            recent_trades = self.trade_data[-50:]
-            buy_trades = [t for t in recent_trades if t["side"].upper() == "BUY"]
-            sell_trades = [t for t in recent_trades if t["side"].upper() == "SELL"]
+            recent_trades = tail(self.trade_data, 50)
+            buy_count, sell_count, buy_volume, sell_volume = self._split_by_side(recent_trades)
             
             return {
                 "total_trades": len(recent_trades),
                 "buy_sell_ratio": {
-                    "trades": len(buy_trades) / len(sell_trades) if sell_trades else 0,
-                    "volume": sum(t["size"] for t in buy_trades) / sum(t["size"] for t in sell_trades) if sell_trades else 0
+                    "trades": buy_count / sell_count if sell_count else 0,
+                    "volume": buy_volume / sell_volume if sell_count else 0
                 },
-                "recent_trades_sample": recent_trades[-5:]
+                "recent_trades_sample": [t._asdict() for t in recent_trades[-5:]]
             }
         except Exception as e:
             self.logger.error(f"Ошибка анализа торговой активности: {e}")
@@ -910,8 +1039,8 @@ class WebSocketManager:
     def _get_price_levels_analysis(self) -> dict:
         """Анализ уровней поддержки и сопротивления"""
         return {
-            "support_levels": self.price_levels["support"][-5:],
-            "resistance_levels": self.price_levels["resistance"][-5:]
+            "support_levels": tail(self.price_levels["support"], 5),
+            "resistance_levels": tail(self.price_levels["resistance"], 5)
         }
     
     def _get_volume_profile_analysis(self) -> dict:
@@ -979,19 +1108,32 @@ class WebSocketManager:
         if not self.trade_data:
             return {}
         
-        recent_trades = self.trade_data[-30:]
-        buy_trades = [t for t in recent_trades if t["side"].upper() == "BUY"]
-        sell_trades = [t for t in recent_trades if t["side"].upper() == "SELL"]
-        
-        buy_volume = sum(t["size"] for t in buy_trades)
-        sell_volume = sum(t["size"] for t in sell_trades)
+        recent_trades = tail(self.trade_data, 30)
+        _, _, buy_volume, sell_volume = self._split_by_side(recent_trades)
+        total_volume = buy_volume + sell_volume
         
         return {
             "buy_sell_ratio": buy_volume / sell_volume if sell_volume > 0 else 0,
-            "order_flow_imbalance": (buy_volume - sell_volume) / (buy_volume + sell_volume) if (buy_volume + sell_volume) > 0 else 0,
+            "order_flow_imbalance": (buy_volume - sell_volume) / total_volume if total_volume > 0 else 0,
             "average_trade_size": sum(t["size"] for t in recent_trades) / len(recent_trades) if recent_trades else 0
         }
     
+    @staticmethod
+    def _split_by_side(trades) -> Tuple[int, int, float, float]:
+        """Количество и объем покупок/продаж за один проход (без промежуточных списков по сторонам)"""
+        buy_count = sell_count = 0
+        buy_volume = sell_volume = 0.0
+        for t in trades:
+            side = t["side"]
+            if side == "BUY":
+                buy_count += 1
+                buy_volume += t["size"]
+            elif side == "SELL":
+                sell_count += 1
+                sell_volume += t["size"]
+        
+        return buy_count, sell_count, buy_volume, sell_volume
+    
     def _assess_data_quality(self) -> dict:
         """Оценка качества данных"""
         return {
@@ -1008,13 +1150,13 @@ class WebSocketManager:
         if not self.extended_kline_data:
             return {}
         
-        first_kline = self.extended_kline_data[0]
-        last_kline = self.extended_kline_data[-1]
+        first_ts = self.extended_kline_data[0]["timestamp"]
+        last_ts = self.extended_kline_data[-1]["timestamp"]
         
         return {
-            "start_time": first_kline["datetime"].isoformat(),
-            "end_time": last_kline["datetime"].isoformat(),
-            "duration_minutes": (last_kline["datetime"] - first_kline["datetime"]).total_seconds() / 60,
+            "start_time": ts_to_datetime(first_ts).isoformat(),
+            "end_time": ts_to_datetime(last_ts).isoformat(),
+            "duration_minutes": (last_ts - first_ts) / 60000,
             "timeframe": self.settings.STRATEGY_TIMEFRAME
         }
     
@@ -1022,7 +1164,7 @@ class WebSocketManager:
         """Получить статус подключения"""
         return {
             "is_connected": self.is_connected,
-            "websocket_active": self.websocket is not None and not self.websocket.closed if self.websocket else False,
+            "websocket_active": self.websocket is not None and self.websocket.state is State.OPEN,
             "last_data_time": self.last_data_time,
             "reconnect_count": self.reconnect_count,
             "message_counts": self.message_counts.copy()
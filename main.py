@@ -16,6 +16,12 @@ from typing import Optional
 
 import uvicorn
 from fastapi import FastAPI, HTTPException
+
+try:
+    import uvloop  # только проверка наличия: цикл создает uvicorn
+    UVLOOP_AVAILABLE = True
+except ImportError:
+    UVLOOP_AVAILABLE = False
 from fastapi.responses import JSONResponse
 
 # Добавляем текущую директорию в путь для импортов
@@ -534,5 +540,7 @@ if __name__ == "__main__":
         host=host,
         port=port,
         reload=False,  # Отключено для продакшена
-        log_level="info"
+        log_level="info",
+        # Выбор event loop - решение точки входа, а не импорта модулей core
+        loop="uvloop" if UVLOOP_AVAILABLE else "asyncio"
     )
@@ -5,6 +5,7 @@ RSI + Moving Average стратегия для фьючерсов (БЕЗ numpy)
 
 import logging
 import math
+from collections import deque
 from datetime import datetime, timedelta
 from typing import Dict, List, Optional, Any
 from dataclasses import dataclass
@@ -143,11 +144,11 @@ class BaseStrategy:
         self.symbol = symbol
         self.timeframe = timeframe
         
-        # Данные для анализа
-        self.kline_data = []
+        # Данные для анализа (deque с maxlen вытесняет старые записи за O(1))
+        self.kline_data = deque(maxlen=self.settings.KLINE_LIMIT)
         self.ticker_data = {}
         self.orderbook_data = {}
-        self.trade_data = []
+        self.trade_data = deque(maxlen=1000)
         
         # История цен для индикаторов
         self.close_prices = []
@@ -177,29 +178,11 @@ class BaseStrategy:
     def update_trades(self, trades: List[dict]):
         """Обновление данных о сделках"""
         self.trade_data.extend(trades)
-        
-        # Ограничиваем размер данных
-        if len(self.trade_data) > 1000:
-            self.trade_data = self.trade_data[-1000:]
     
     async def analyze_kline(self, kline: dict) -> Optional[TradingSignal]:
         """Анализ новой свечи и генерация сигнала"""
         try:
-            # Добавляем данные свечи
-            self.kline_data.append(kline)
-            self.close_prices.append(kline["close"])
-            self.high_prices.append(kline["high"])
-            self.low_prices.append(kline["low"])
-            self.volumes.append(kline["volume"])
-            
-            # Ограничиваем размер данных
-            max_data = self.settings.KLINE_LIMIT
-            if len(self.close_prices) > max_data:
-                self.close_prices = self.close_prices[-max_data:]
-                self.high_prices = self.high_prices[-max_data:]
-                self.low_prices = self.low_prices[-max_data:]
-                self.volumes = self.volumes[-max_data:]
-                self.kline_data = self.kline_data[-max_data:]
+            self._append_kline(kline)
             
             # Генерируем сигнал только для подтвержденных свечей
             if kline.get("confirm", False) and len(self.close_prices) >= 30:
@@ -211,6 +194,41 @@ class BaseStrategy:
             self.logger.error(f"❌ Ошибка анализа kline: {e}")
             return None
     
+    async def analyze_klines(self, klines: List[dict]) -> List[TradingSignal]:
+        """Анализ пакета свечей одного кадра за один вызов"""
+        # Каждая подтвержденная свеча проверяется на сигнал в том же состоянии рядов, что и при analyze_kline
+        signals = []
+        try:
+            for kline in klines:
+                self._append_kline(kline)
+                
+                if kline.get("confirm", False) and len(self.close_prices) >= 30:
+                    signal = await self._generate_signal()
+                    if signal:
+                        signals.append(signal)
+            
+        except Exception as e:
+            self.logger.error(f"❌ Ошибка анализа пакета kline: {e}")
+        
+        return signals
+    
+    def _append_kline(self, kline: dict):
+        """Добавление свечи в ряды цен"""
+        self.kline_data.append(kline)
+        self.close_prices.append(kline["close"])
+        self.high_prices.append(kline["high"])
+        self.low_prices.append(kline["low"])
+        self.volumes.append(kline["volume"])
+        
+        # Ограничиваем размер данных (ряды цен остаются list - индикаторы берут срезы;
+        # обрезаем на месте, без создания новых списков)
+        max_data = self.settings.KLINE_LIMIT
+        if len(self.close_prices) > max_data:
+            del self.close_prices[:-max_data]
+            del self.high_prices[:-max_data]
+            del self.low_prices[:-max_data]
+            del self.volumes[:-max_data]
+    
     async def _generate_signal(self) -> Optional[TradingSignal]:
         """Генерация торгового сигнала"""
         try:
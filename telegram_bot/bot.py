@@ -244,7 +244,7 @@ class TelegramBot:
             # Отправляем сообщение об остановке
             try:
                 await self.send_message("Бот остановлен\n\nСервис временно недоступен.")
-            except:
+            except Exception:
                 pass
             
             # Правильная остановка polling